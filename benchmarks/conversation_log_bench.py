@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Compare conversation log throughput: open-per-line appends vs ConversationLogWriter
+
+Usage:
+  python benchmarks/conversation_log_bench.py [--messages N] [--conversations N] [--threads N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "nanda_adapter", "core"))
+from conversation_log import ConversationLogWriter
+
+
+def make_entry(conversation_id, i):
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "conversation_id": conversation_id,
+        "path": "agent_a>agent_b",
+        "source": "Local user to Agent agent_a",
+        "message": f"benchmark message {i} " + "x" * 120,
+    }
+
+
+def legacy_write(log_dir, conversation_id, entry):
+    """The original log_message behaviour: open, append one line, close"""
+    log_filename = os.path.join(log_dir, f"conversation_{conversation_id}.jsonl")
+    with open(log_filename, "a") as log_file:
+        log_file.write(json.dumps(entry) + "\n")
+
+
+def run(label, write, args):
+    per_thread = args.messages // args.threads
+
+    def worker(t):
+        for i in range(per_thread):
+            conversation_id = f"conv{(t * per_thread + i) % args.conversations}"
+            write(conversation_id, make_entry(conversation_id, i))
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    enqueued = time.perf_counter() - start
+    return label, per_thread * args.threads, enqueued
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--conversations", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--fsync", default="never", choices=["never", "batch", "always"])
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as log_dir:
+        results.append(
+            run("open-per-line", lambda c, e: legacy_write(log_dir, c, e), args)
+        )
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        writer = ConversationLogWriter(log_dir, fsync=args.fsync)
+        label, count, caller_time = run("ConversationLogWriter", writer.write, args)
+        start = time.perf_counter()
+        writer.close()
+        drain = time.perf_counter() - start
+        results.append((label, count, caller_time))
+        results.append(("ConversationLogWriter incl. drain", count, caller_time + drain))
+        print(f"writer stats: {writer.stats()}")
+
+    print(f"{'mode':<36}{'messages':>10}{'seconds':>10}{'msg/s':>12}")
+    for label, count, seconds in results:
+        print(f"{label:<36}{count:>10}{seconds:>10.3f}{count / seconds:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
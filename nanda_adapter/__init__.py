@@ -6,13 +6,14 @@ This package provides a framework for creating customizable AI agents with plugg
 message improvement logic, built on top of the python_a2a communication framework.
 """
 
-from .core.nanda import NANDA
-from .core.agent_bridge import (
+from .core import (
+    NANDA,
     AgentBridge, 
     message_improver, 
     register_message_improver, 
     get_message_improver, 
-    list_message_improvers
+    list_message_improvers,
+    get_improver_cache_stats
 )
 
 __version__ = "1.0.0"
@@ -26,5 +27,6 @@ __all__ = [
     "message_improver",
     "register_message_improver", 
     "get_message_improver",
-    "list_message_improvers"
+    "list_message_improvers",
+    "get_improver_cache_stats"
 ]
\ No newline at end of file
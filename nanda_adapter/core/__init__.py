@@ -6,12 +6,15 @@ This module contains the core components of the NANDA agent framework.
 """
 
 from .nanda import NANDA
-from .agent_bridge import (
+# Re-export from the agent_bridge module NANDA itself uses so improver
+# registrations and stats share one registry
+from .nanda import (
     AgentBridge, 
     message_improver, 
     register_message_improver, 
     get_message_improver, 
-    list_message_improvers
+    list_message_improvers,
+    get_improver_cache_stats
 )
 
 __all__ = [
@@ -20,5 +23,6 @@ __all__ = [
     "message_improver",
     "register_message_improver", 
     "get_message_improver",
-    "list_message_improvers"
+    "list_message_improvers",
+    "get_improver_cache_stats"
 ]
\ No newline at end of file
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Bounded background delivery of fire-and-forget A2A messages
+
+Sends are hashed by destination URL onto a fixed set of lanes. Each lane is
+a bounded queue drained by one worker thread, so messages to the same
+destination are delivered in order, the number of threads never grows with
+traffic and a full lane pushes back on the caller. Every send returns a
+``concurrent.futures.Future`` that resolves to the response Message or to a
+``DeliveryError`` after the retries are exhausted.
+
+A failed send waits for its retry on a per-lane timer rather than in the
+lane's thread: later messages to the same URL queue up behind it, while
+other destinations sharing the lane keep being delivered.
+"""
+
+import atexit
+import heapq
+import os
+import queue
+import random
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future
+
+from python_a2a import ErrorContent
+
+from a2a_pool import a2a_pool
+
+# Lane marker
+_STOP = object()
+
+
+class DeliveryError(Exception):
+    """A message could not be delivered after all retries"""
+
+
+class _Send:
+    __slots__ = ("url", "message", "timeout", "future", "attempt")
+
+    def __init__(self, url, message, timeout):
+        self.url = url
+        self.message = message
+        self.timeout = timeout
+        self.future = Future()
+        self.attempt = 0
+
+
+class A2ADispatcher:
+    """Per-destination ordered delivery on a fixed pool of worker lanes"""
+
+    def __init__(
+        self,
+        pool,
+        lanes=8,
+        queue_size=1000,
+        retries=2,
+        backoff=0.5,
+        backoff_max=5.0,
+        enqueue_timeout=5.0,
+    ):
+        self.pool = pool
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.enqueue_timeout = enqueue_timeout
+        self._lanes = [queue.Queue(maxsize=queue_size) for _ in range(max(1, lanes))]
+        # Per lane: url -> deque of sends held behind a pending retry
+        self._waiting = [{} for _ in self._lanes]
+        self._threads = []
+        self._closed = False
+        self._lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "delivered": 0,
+            "failed": 0,
+            "retries": 0,
+            "rejected": 0,
+            "max_queue_depth": 0,
+        }
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i, lane in enumerate(self._lanes):
+                thread = threading.Thread(
+                    target=self._run,
+                    args=(lane, self._waiting[i]),
+                    name=f"a2a-send-{i}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+            atexit.register(self.close)
+
+    def submit(self, url, message, timeout=30):
+        """Queue ``message`` for ``url`` and return a Future for its delivery.
+
+        Blocks for up to ``enqueue_timeout`` seconds when the destination's
+        lane is full, then raises ``queue.Full``.
+        """
+        if self._closed:
+            raise RuntimeError("A2ADispatcher is closed")
+        self._ensure_started()
+        lane = self._lanes[zlib.crc32(url.encode("utf-8")) % len(self._lanes)]
+        send = _Send(url, message, timeout)
+        try:
+            lane.put(send, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._count("rejected")
+            print(f"A2A send queue full, dropping message to {url}")
+            raise
+        depth = lane.qsize()
+        with self._lock:
+            self._stats["submitted"] += 1
+            if depth > self._stats["max_queue_depth"]:
+                self._stats["max_queue_depth"] = depth
+        return send.future
+
+    def _run(self, lane, waiting):
+        # (retry_at, url) for every url in ``waiting``
+        timers = []
+        stopping = False
+        while not (stopping and not waiting):
+            timeout = max(0.0, timers[0][0] - time.monotonic()) if timers else None
+            try:
+                send = lane.get(timeout=timeout)
+            except queue.Empty:
+                send = None
+            if send is _STOP:
+                stopping = True
+            elif send is not None and send.future.set_running_or_notify_cancel():
+                if send.url in waiting:
+                    # Keeps messages to this URL in order behind its retry
+                    waiting[send.url].append(send)
+                else:
+                    self._drain(send.url, deque([send]), waiting, timers)
+            while timers and timers[0][0] <= time.monotonic():
+                _, url = heapq.heappop(timers)
+                self._drain(url, waiting.pop(url), waiting, timers)
+
+    def _drain(self, url, backlog, waiting, timers):
+        """Deliver ``backlog`` in order; park it until its retry time if a send fails"""
+        while backlog:
+            delay = self._attempt(backlog[0])
+            if delay is not None:
+                waiting[url] = backlog
+                heapq.heappush(timers, (time.monotonic() + delay, url))
+                return
+            backlog.popleft()
+
+    def _attempt(self, send):
+        """Try one delivery; returns seconds until the retry, or None when done"""
+        try:
+            response = self.pool.send_message(send.url, send.message, send.timeout)
+            if isinstance(response.content, ErrorContent):
+                raise DeliveryError(response.content.message)
+            self._count("delivered")
+            send.future.set_result(response)
+            return None
+        except Exception as e:
+            if send.attempt >= self.retries:
+                self._count("failed")
+                print(
+                    f"Error sending message to {send.url} after {send.attempt + 1} attempts: {e}"
+                )
+                if not isinstance(e, DeliveryError):
+                    e = DeliveryError(f"{send.url}: {e}")
+                send.future.set_exception(e)
+                return None
+        self._count("retries")
+        delay = min(self.backoff_max, self.backoff * (2**send.attempt))
+        send.attempt += 1
+        return random.uniform(delay / 2, delay)
+
+    def stats(self):
+        """Return delivery counters and current queue depths"""
+        with self._lock:
+            stats = dict(self._stats)
+        depths = [lane.qsize() for lane in self._lanes]
+        stats["queue_depth"] = sum(depths)
+        stats["lane_depths"] = depths
+        stats["awaiting_retry"] = sum(
+            len(backlog) for waiting in self._waiting for backlog in list(waiting.values())
+        )
+        return stats
+
+    def close(self, timeout=10.0):
+        """Stop accepting sends and give queued ones up to ``timeout`` seconds"""
+        if self._closed:
+            return
+        self._closed = True
+        for lane in self._lanes:
+            try:
+                lane.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+
+a2a_dispatcher = A2ADispatcher(
+    a2a_pool,
+    lanes=int(os.getenv("A2A_SEND_WORKERS", "8")),
+    queue_size=int(os.getenv("A2A_SEND_QUEUE_SIZE", "1000")),
+    retries=int(os.getenv("A2A_SEND_RETRIES", "2")),
+    enqueue_timeout=float(os.getenv("A2A_SEND_ENQUEUE_TIMEOUT", "5")),
+)
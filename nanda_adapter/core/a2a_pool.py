@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Pooled A2A clients
+
+python_a2a's A2AClient issues every request through module-level
+``requests.get/post`` and fetches the agent card each time it is built, so a
+fresh client per message pays connection setup plus an extra round trip.
+This module keeps one keep-alive ``requests.Session`` and one
+PooledA2AClient per target URL. The pooled client sends through that session
+itself and leaves python_a2a's module untouched.
+"""
+
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from python_a2a import A2AClient, ErrorContent, Message, MessageRole, TextContent
+from python_a2a.exceptions import A2AConnectionError
+
+
+class PooledA2AClient(A2AClient):
+    """A2AClient whose sends go through a shared keep-alive session
+
+    Messages are posted to the endpoint in python_a2a's message format,
+    which python_a2a agents such as agent bridges accept. If the endpoint
+    rejects it, the client falls back to A2AClient.send_message, which tries
+    other endpoints and formats without the pooled session.
+    """
+
+    def __init__(self, endpoint_url, session, timeout=30, **kwargs):
+        self.session = session
+        super().__init__(endpoint_url, timeout=timeout, **kwargs)
+
+    def _fetch_agent_card(self):
+        # The card only hints at the message format, which the first
+        # response shows as well; A2AClient then uses a placeholder card
+        raise A2AConnectionError("pooled clients do not fetch agent cards")
+
+    def send_message(self, message):
+        payload = message.to_google_a2a() if self._use_google_a2a else message.to_dict()
+        try:
+            response = self.session.post(
+                self.endpoint_url, json=payload, headers=self.headers, timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            return Message(
+                content=ErrorContent(message=f"Failed to reach agent at {self.endpoint_url}: {e}"),
+                role=MessageRole.AGENT,
+                parent_message_id=message.message_id,
+                conversation_id=message.conversation_id,
+            )
+        try:
+            response.raise_for_status()
+            data = response.json()
+        except ValueError:
+            text = response.text.strip()
+            if not text:
+                return super().send_message(message)
+            return Message(
+                content=TextContent(text=text),
+                role=MessageRole.AGENT,
+                parent_message_id=message.message_id,
+                conversation_id=message.conversation_id,
+            )
+        except requests.HTTPError:
+            return super().send_message(message)
+        if isinstance(data.get("parts"), list) and "role" in data and "content" not in data:
+            self._use_google_a2a = True
+            return Message.from_google_a2a(data)
+        return Message.from_dict(data)
+
+
+class _PoolEntry:
+    def __init__(self, session):
+        self.session = session
+        self.clients = {}
+        self.last_used = time.monotonic()
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+
+
+class A2AClientPool:
+    """Keep-alive A2A clients keyed by target URL with idle eviction and health tracking"""
+
+    def __init__(self, pool_maxsize=10, idle_timeout=300.0, max_failures=3):
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self.max_failures = max_failures
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _evict_idle(self, now):
+        for url, entry in list(self._entries.items()):
+            if now - entry.last_used > self.idle_timeout:
+                del self._entries[url]
+                entry.session.close()
+
+    def _entry(self, url):
+        now = time.monotonic()
+        self._evict_idle(now)
+        entry = self._entries.get(url)
+        if entry is None:
+            entry = self._entries[url] = _PoolEntry(self._new_session())
+        entry.last_used = now
+        return entry
+
+    def get_session(self, url):
+        """Return the keep-alive session for ``url`` for plain HTTP calls"""
+        with self._lock:
+            return self._entry(url).session
+
+    def get_client(self, url, timeout=30):
+        """Return a pooled client for ``url``, creating it on first use"""
+        with self._lock:
+            entry = self._entry(url)
+            client = entry.clients.get(timeout)
+        if client is None:
+            # Built outside the lock: the constructor fetches the agent card
+            client = PooledA2AClient(url, entry.session, timeout=timeout)
+            with self._lock:
+                client = entry.clients.setdefault(timeout, client)
+        return client
+
+    def record_success(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry:
+                entry.successes += 1
+                entry.consecutive_failures = 0
+
+    def record_failure(self, url):
+        """Count a failed send; unhealthy targets get fresh connections next time"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if not entry:
+                return
+            entry.failures += 1
+            entry.consecutive_failures += 1
+            if entry.consecutive_failures >= self.max_failures:
+                print(f"A2A target {url} marked unhealthy, dropping pooled connections")
+                del self._entries[url]
+                entry.session.close()
+
+    def send_message(self, url, message, timeout=30):
+        """Send a message through the pooled client for ``url``"""
+        try:
+            response = self.get_client(url, timeout).send_message(message)
+        except Exception:
+            self.record_failure(url)
+            raise
+        if isinstance(response.content, ErrorContent):
+            self.record_failure(url)
+        else:
+            self.record_success(url)
+        return response
+
+    def stats(self):
+        """Return per-target health counters"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                url: {
+                    "successes": entry.successes,
+                    "failures": entry.failures,
+                    "consecutive_failures": entry.consecutive_failures,
+                    "idle_seconds": round(now - entry.last_used, 1),
+                }
+                for url, entry in self._entries.items()
+            }
+
+    def close(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.session.close()
+
+
+a2a_pool = A2AClientPool(
+    pool_maxsize=int(os.getenv("A2A_POOL_MAXSIZE", "10")),
+    idle_timeout=float(os.getenv("A2A_POOL_IDLE_TIMEOUT", "300")),
+    max_failures=int(os.getenv("A2A_POOL_MAX_FAILURES", "3")),
+)
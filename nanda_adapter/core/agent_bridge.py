@@ -1,17 +1,19 @@
 # agent_bridge.py
 import os
 import uuid
+import contextlib
+import hmac
+import ipaddress
 import traceback
 import json
-import threading
-import requests
+import re
+import queue
 from typing import Optional
 from datetime import datetime
 from anthropic import Anthropic, APIStatusError
 from python_a2a import (
     A2AServer,
     A2AClient,
-    run_server,
     Message,
     TextContent,
     MessageRole,
@@ -19,7 +21,22 @@ from python_a2a import (
     Metadata,
 )
 import asyncio
-from mcp_utils import MCPClient
+from mcp_utils import MCPClient, get_async_anthropic, mcp_session_pool, tool_catalog_cache
+from ttl_cache import MISSING, TTLCache
+from a2a_pool import a2a_pool
+from a2a_dispatch import a2a_dispatcher
+from ui_outbox import UIClientRegistry
+from registry_client import registry_client
+from registry_config import get_registry_url
+from conversation_log import ConversationLogWriter
+from completion_cache import CompletionCache, completion_key
+from improver_cache import MemoizedImprover
+from singleflight import SingleFlight
+from agent_directory import AgentDirectory
+from wsgi_serving import on_worker_exit, serve_agent, serving_options
+from state_backend import ScopedStateBackend, create_state_backend
+from bridge_loop import bridge_loop, run_blocking, run_sync
+from chat_ui_patch import add_stream_route
 import base64
 
 import sys
@@ -56,17 +73,93 @@ LOCAL_TERMINAL_URL = f"http://localhost:{TERMINAL_PORT}/a2a"
 # UI client support
 UI_MODE = os.getenv("UI_MODE", "true").lower() in ("true", "1", "yes", "y")
 UI_CLIENT_URL = os.getenv("UI_CLIENT_URL", "")
-registered_ui_clients = set()
 
 # Set up logging directory
 LOG_DIR = os.getenv("LOG_DIR", "conversation_logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 
+# Conversation logs are written in batches by a background thread
+conversation_logger = ConversationLogWriter(
+    LOG_DIR,
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    flush_entries=int(os.getenv("LOG_FLUSH_ENTRIES", "100")),
+    flush_interval_ms=int(os.getenv("LOG_FLUSH_INTERVAL_MS", "200")),
+    fsync=os.getenv("LOG_FSYNC", "never"),
+    max_open_files=int(os.getenv("LOG_MAX_OPEN_FILES", "64")),
+)
+
+# UI clients receive messages in the background, each through its own outbox.
+# UI_CLIENT_URL (read on first use, launchers set it after import) is
+# registered automatically; more clients register via /ui_clients/register
+def _state_db_path():
+    # Resolved on first use: launchers set AGENT_ID after agent_bridge is imported
+    agent_id = re.sub(r"[^\w.-]", "_", get_agent_id())
+    return os.getenv("NANDA_STATE_DB") or os.path.join(LOG_DIR, f"bridge_state_{agent_id}.db")
+
+
+# State shared by bridge worker processes; "sqlite" when running several workers
+# (see use_shared_state). Keys and conversation locks are scoped to the agent in
+# case agents share a file
+STATE_BACKEND = os.getenv("NANDA_STATE_BACKEND", "")
+state_backend = ScopedStateBackend(
+    create_state_backend(STATE_BACKEND or "memory", _state_db_path),
+    get_agent_id,
+)
+# Longest a message waits for earlier messages of its conversation
+CONVERSATION_LOCK_TIMEOUT = float(os.getenv("NANDA_CONVERSATION_LOCK_TIMEOUT", "120"))
+
+# /ui_clients and /stats answer loopback callers, and remote callers that send
+# "Authorization: Bearer <BRIDGE_ADMIN_TOKEN>" when a token is configured
+BRIDGE_ADMIN_TOKEN = os.getenv("BRIDGE_ADMIN_TOKEN", "")
+# Upper bounds for outbox options requested through /ui_clients/register
+UI_CLIENT_MAX_WORKERS = int(os.getenv("UI_CLIENT_MAX_WORKERS", "4"))
+UI_CLIENT_MAX_PENDING = int(os.getenv("UI_CLIENT_MAX_PENDING", "10000"))
+
+registered_ui_clients = UIClientRegistry(
+    state=state_backend if state_backend.shared else None,
+    max_pending=int(os.getenv("UI_OUTBOX_QUEUE_SIZE", "1000")),
+    workers=int(os.getenv("UI_OUTBOX_WORKERS", "1")),
+    overflow=os.getenv("UI_OUTBOX_OVERFLOW", "drop_newest"),
+    retries=int(os.getenv("UI_OUTBOX_RETRIES", "3")),
+    timeout=float(os.getenv("UI_OUTBOX_TIMEOUT", "10")),
+    dead_letter_path=os.getenv("UI_DEAD_LETTER_FILE")
+    or os.path.join(LOG_DIR, "ui_dead_letter.jsonl"),
+)
+
+
+def use_shared_state(workers):
+    """Prepare the bridge's state for ``workers`` processes; returns whether it is shared
+
+    With several workers and no NANDA_STATE_BACKEND the bridge switches to
+    the sqlite backend. An explicit memory backend is refused: each worker
+    would keep its own UI clients and conversation locks.
+    """
+    if workers <= 1 or state_backend.shared:
+        return state_backend.shared
+    if STATE_BACKEND:
+        raise ValueError(
+            f"NANDA_STATE_BACKEND={STATE_BACKEND} keeps state per process; "
+            f"use sqlite to run {workers} bridge workers"
+        )
+    state_backend.backend = create_state_backend("sqlite", _state_db_path)
+    registered_ui_clients.state = state_backend
+    print(f"Running {workers} bridge workers: using the sqlite state backend")
+    return True
+
+
+# Worker processes flush these as they exit (last registered runs first)
+on_worker_exit(conversation_logger.close)
+on_worker_exit(registered_ui_clients.close)
+on_worker_exit(a2a_dispatcher.close)
+
 # Configure system prompts based on agent ID (examples from the original code)
 SYSTEM_PROMPTS = {
     "default": "You are Claude assisting a user (Agent). Assume the messages you get are part of a conversation with other agents. Help the user communicate effectively with other agents."
 }
 
+# System prompt for private /query requests
+QUERY_SYSTEM_PROMPT = "You are Claude, an AI assistant. Provide a direct, helpful response to the user's question. Treat it as a private request for guidance and respond only to the user."
+
 # Configure message improvement prompts
 IMPROVE_MESSAGE_PROMPTS = {
     "default": "Improve the following message to make it more clear, compelling, and professional without changing the core content or adding fictional information. Keep the same overall meaning but enhance the phrasing and structure. Don't make it too verbose - keep it concise but impactful. Return only the improved message without explanations or introductions."
@@ -76,22 +169,56 @@ SMITHERY_API_KEY = (
     os.getenv("SMITHERY_API_KEY") or "bfcb8cec-9d56-4957-8156-bced0bfca532"
 )
 
+# Registry lookup cache: agent_id -> agent_url (None for unknown agents)
+agent_url_cache = TTLCache(
+    maxsize=int(os.getenv("AGENT_LOOKUP_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("AGENT_LOOKUP_TTL", "300")),
+    negative_ttl=float(os.getenv("AGENT_LOOKUP_NEGATIVE_TTL", "30")),
+    stale_ttl=float(os.getenv("AGENT_LOOKUP_STALE_TTL", "600")),
+)
+
+# Claude completion cache; opt-in because responses are reused across conversations
+completion_cache = CompletionCache(
+    enabled=os.getenv("CLAUDE_CACHE", "false").lower() in ("true", "1", "yes", "y"),
+    maxsize=int(os.getenv("CLAUDE_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("CLAUDE_CACHE_TTL", "3600")),
+    db_path=os.getenv("CLAUDE_CACHE_DB") or None,
+    max_disk_entries=int(os.getenv("CLAUDE_CACHE_DB_MAX_ENTRIES", "10000")),
+    bypass_maxsize=int(os.getenv("CLAUDE_CACHE_BYPASS_SIZE", "10000")),
+    bypass_ttl=float(os.getenv("CLAUDE_CACHE_BYPASS_TTL", "86400")),
+)
 
-def get_registry_url():
-    """Get the registry URL from file or use default"""
-    try:
-        if os.path.exists("registry_url.txt"):
-            with open("registry_url.txt", "r") as f:
-                registry_url = f.read().strip()
-                print(f"Using registry URL from file: {registry_url}")
-                return registry_url
-    except Exception as e:
-        print(f"Error reading registry URL from file: {e}")
 
-    # Default if file doesn't exist
-    default_url = "https://chat.nanda-registry.com:6900"
-    print(f"Using default registry URL: {default_url}")
-    return default_url
+def _on_directory_change(listing, agent_ids):
+    # Cached lookups for agents that moved or left the registry are outdated
+    for agent_id in agent_ids:
+        agent_url_cache.invalidate(agent_id)
+        directory_misses.invalidate(agent_id)
+
+
+# Agents whose directory URL failed; looked up in the registry until the
+# directory changes for them or the entry expires
+directory_misses = TTLCache(
+    maxsize=int(os.getenv("AGENT_LOOKUP_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("AGENT_INDEX_SYNC_INTERVAL", "60")),
+)
+
+# Local copy of the registry's /list, refreshed in the background from bridge startup
+agent_directory = AgentDirectory(
+    registry_client,
+    get_registry_url,
+    refresh_interval=float(os.getenv("AGENT_INDEX_SYNC_INTERVAL", "60")),
+    endpoints=(("list", "/list"),),
+    on_change=_on_directory_change,
+    db_path=os.getenv("AGENT_INDEX_DB") or None,
+    # Opt-in registry changes feed, e.g. /list/changes (see AgentDirectory)
+    changes_path=os.getenv("AGENT_INDEX_CHANGES_PATH") or None,
+)
+
+# Concurrent identical upstream calls share one request
+claude_flight = SingleFlight("claude")
+improver_flight = SingleFlight("improver")
+registry_flight = SingleFlight("registry")
 
 
 def register_with_registry(agent_id, agent_url, api_url):
@@ -106,7 +233,9 @@ def register_with_registry(agent_id, agent_url, api_url):
         print(
             f"Registering agent {agent_id} with URL {agent_url} at registry {registry_url}..."
         )
-        response = requests.post(f"{registry_url}/register", json=data)
+        response = registry_client.post(
+            f"{registry_url}/register", "register", json=data
+        )
         if response.status_code == 200:
             print(f"Agent {agent_id} registered successfully")
             return True
@@ -118,41 +247,139 @@ def register_with_registry(agent_id, agent_url, api_url):
         return False
 
 
-def lookup_agent(agent_id):
-    """Look up an agent's URL in the registry"""
+def _fetch_agent_url(agent_id):
+    """Fetch an agent's URL from the registry; raises if the registry is unavailable"""
     registry_url = get_registry_url()
+    print(f"Looking up agent {agent_id} in registry {registry_url}...")
+    response = registry_client.get(f"{registry_url}/lookup/{agent_id}", "lookup")
+    if response.status_code == 200:
+        agent_url = response.json().get("agent_url")
+        print(f"Found agent {agent_id} at URL: {agent_url}")
+        return agent_url
+    if response.status_code >= 500:
+        raise RuntimeError(f"registry returned {response.status_code}")
+    print(f"Agent {agent_id} not found in registry")
+    return None
+
+
+def lookup_agent(agent_id):
+    """Look up an agent's URL in the local agent directory, then the registry
+
+    Agents the directory does not know yet, or whose directory URL failed,
+    are looked up in the registry through the lookup cache. If the registry
+    cannot be reached the directory's URL is used anyway.
+    """
+    agent_directory.start()
+    snapshot = agent_directory.peek()
+    local_url = snapshot.agent_url(agent_id) if snapshot is not None else None
+    if local_url and directory_misses.get(agent_id)[0] is MISSING:
+        return local_url
     try:
-        print(f"Looking up agent {agent_id} in registry {registry_url}...")
-        response = requests.get(f"{registry_url}/lookup/{agent_id}")
-        if response.status_code == 200:
-            agent_url = response.json().get("agent_url")
-            print(f"Found agent {agent_id} at URL: {agent_url}")
-            return agent_url
-        print(f"Agent {agent_id} not found in registry")
-        return None
+        return agent_url_cache.get_or_load(
+            agent_id, lambda key: registry_flight.do(("lookup", key), _fetch_agent_url, key)
+        )
     except Exception as e:
         print(f"Error looking up agent {agent_id}: {e}")
-        return None
+        if local_url:
+            print(f"Using agent directory URL for {agent_id} while the registry is unavailable")
+        return local_url
+
+
+def invalidate_agent_lookup(agent_id):
+    """Forget the cached URL for an agent so the next lookup hits the registry"""
+    directory_misses.set(agent_id, True)
+    if agent_url_cache.invalidate(agent_id):
+        print(f"Invalidated cached URL for agent {agent_id}")
+
+
+def get_lookup_cache_stats():
+    """Return hit/miss counters for the registry lookup cache"""
+    return agent_url_cache.stats()
+
+
+def get_completion_cache_stats():
+    """Return hit/miss counters for the Claude completion cache"""
+    return completion_cache.stats()
+
+
+def get_send_queue_stats():
+    """Return delivery counters and queue depths for background A2A sends"""
+    return a2a_dispatcher.stats()
+
+
+def get_a2a_pool_stats():
+    """Return per-target health counters of the pooled A2A clients"""
+    return a2a_pool.stats()
+
+
+def get_ui_client_stats():
+    """Return delivery stats per registered UI client"""
+    return registered_ui_clients.stats()
+
+
+def get_state_backend_stats():
+    """Return conversation lock counters of the shared state backend"""
+    return state_backend.stats()
+
+
+def get_singleflight_stats():
+    """Return how many calls were coalesced onto in-flight requests"""
+    return {
+        flight.name: flight.stats()
+        for flight in (claude_flight, improver_flight, registry_flight)
+    }
 
 
 def list_registered_agents():
-    """Get a list of all registered agents from the registry"""
-    registry_url = get_registry_url()
+    """Get a list of all registered agents as returned by the registry's /list
+
+    Served from the local agent directory, which is refreshed in the
+    background; None is returned only if the registry has never been reachable.
+    """
     try:
-        print(f"Requesting list of agents from registry {registry_url}...")
-        response = requests.get(f"{registry_url}/list")
-        if response.status_code == 200:
-            agents = response.json()
-            return agents
-        print(f"Failed to get list of agents from registry")
-        return None
+        # Decoded from the snapshot's body so callers get their own copy
+        return json.loads(agent_directory.snapshot().body)
     except Exception as e:
         print(f"Error getting list of agents: {e}")
         return None
 
 
+def get_agent_directory_stats():
+    """Return refresh counters and size of the local agent directory"""
+    return agent_directory.stats()
+
+
+async def _mcp_stats():
+    # The MCP pool and catalog cache belong to the bridge loop
+    return {"sessions": mcp_session_pool.stats(), "tool_catalogs": tool_catalog_cache.stats()}
+
+
+def get_bridge_stats():
+    """Return every cache, pool and queue counter of this bridge process"""
+    stats = {
+        "agent_id": get_agent_id(),
+        "pid": os.getpid(),
+        "lookup_cache": get_lookup_cache_stats(),
+        "completion_cache": get_completion_cache_stats(),
+        "improver_caches": get_improver_cache_stats(),
+        "singleflight": get_singleflight_stats(),
+        "a2a_pool": get_a2a_pool_stats(),
+        "send_queue": get_send_queue_stats(),
+        "ui_clients": get_ui_client_stats(),
+        "agent_directory": get_agent_directory_stats(),
+        "state_backend": get_state_backend_stats(),
+        "conversation_log": conversation_logger.stats(),
+        "registry_latency": registry_client.latency_stats(),
+    }
+    try:
+        stats["mcp"] = run_sync(_mcp_stats(), timeout=5)
+    except Exception as e:
+        stats["mcp"] = {"error": str(e)}
+    return stats
+
+
 def log_message(conversation_id, path, source, message_text):
-    """Log each message to a JSON file"""
+    """Queue a message for the conversation's JSON log file"""
     timestamp = datetime.now().isoformat()
     log_entry = {
         "timestamp": timestamp,
@@ -162,16 +389,69 @@ def log_message(conversation_id, path, source, message_text):
         "message": message_text,
     }
 
-    # Create a log file for this conversation if it doesn't exist
-    log_filename = os.path.join(LOG_DIR, f"conversation_{conversation_id}.jsonl")
-
-    # Append the log entry to local file
-    with open(log_filename, "a") as log_file:
-        log_file.write(json.dumps(log_entry) + "\n")
+    # Appended to conversation_{id}.jsonl by the background writer
+    conversation_logger.write(conversation_id, log_entry)
 
     print(f"Logged message from {source} in conversation {conversation_id}")
 
 
+def build_claude_request(
+    prompt: str, additional_context: str, system_prompt: str = None
+) -> dict:
+    """Build the messages.create arguments shared by call_claude and call_claude_async"""
+    # Use the specified system prompt or default to the agent's system prompt
+    if system_prompt:
+        system = system_prompt
+    else:
+        # Use the agent's specific prompt if available, otherwise use default
+        system = SYSTEM_PROMPTS["default"]
+
+    # Combine the prompt with additional context if provided
+    full_prompt = prompt
+    if additional_context and additional_context.strip():
+        full_prompt = f"ADDITIONAL CONTEXT FROM USER: {additional_context}\n\nMESSAGE: {prompt}"
+
+    return {
+        "model": "claude-3-5-sonnet-20241022",
+        "max_tokens": 512,
+        "messages": [{"role": "user", "content": full_prompt}],
+        "system": system,
+    }
+
+
+def claude_error_fallback(e: Exception, prompt: str) -> Optional[str]:
+    """Report a failed Claude call and return the fallback text, if any"""
+    agent_id = get_agent_id()
+    if isinstance(e, APIStatusError):
+        print(
+            f"Agent {agent_id}: Anthropic API error:",
+            e.status_code,
+            e.message,
+            flush=True,
+        )
+        # If we hit a credit limit error, return a fallback message
+        if "credit balance is too low" in str(e):
+            return f"Agent {agent_id} processed (API credit limit reached): {prompt}"
+    else:
+        print(f"Agent {agent_id}: Anthropic SDK error:", e, flush=True)
+        traceback.print_exc()
+    return None
+
+
+def _create_completion(request: dict, conversation_id: str) -> str:
+    resp = anthropic.messages.create(**request)
+    response_text = resp.content[0].text
+    completion_cache.put(request, response_text, conversation_id)
+    return response_text
+
+
+async def _create_completion_async(request: dict, conversation_id: str) -> str:
+    resp = await get_async_anthropic().messages.create(**request)
+    response_text = resp.content[0].text
+    completion_cache.put(request, response_text, conversation_id)
+    return response_text
+
+
 def call_claude(
     prompt: str,
     additional_context: str,
@@ -181,46 +461,101 @@ def call_claude(
 ) -> Optional[str]:
     """Wrapper that never raises: returns text or None on failure."""
     try:
-        # Use the specified system prompt or default to the agent's system prompt
-        if system_prompt:
-            system = system_prompt
+        request = build_claude_request(prompt, additional_context, system_prompt)
+        agent_id = get_agent_id()
+        full_prompt = request["messages"][0]["content"]
+        response_text = completion_cache.get(request, conversation_id)
+        if response_text is not None:
+            print(f"Agent {agent_id}: Claude response served from cache")
         else:
-            # Use the agent's specific prompt if available, otherwise use default
-            system = SYSTEM_PROMPTS["default"]
+            print(f"Agent {agent_id}: Calling Claude with prompt: {full_prompt[:50]}...")
+            if completion_cache.bypasses(conversation_id):
+                # no_cache conversations never take another caller's in-flight result
+                response_text = _create_completion(request, conversation_id)
+            else:
+                response_text = claude_flight.do(
+                    completion_key(request), _create_completion, request, conversation_id
+                )
 
-        # Combine the prompt with additional context if provided
-        full_prompt = prompt
-        if additional_context and additional_context.strip():
-            full_prompt = f"ADDITIONAL CONTEXT FROM USER: {additional_context}\n\nMESSAGE: {prompt}"
+        # Log the Claude response
+        log_message(conversation_id, current_path, f"Claude {agent_id}", response_text)
 
+        return response_text
+    except Exception as e:
+        return claude_error_fallback(e, prompt)
+
+
+async def call_claude_async(
+    prompt: str,
+    additional_context: str,
+    conversation_id: str,
+    current_path: str,
+    system_prompt: str = None,
+) -> Optional[str]:
+    """Async call_claude using the process-wide AsyncAnthropic client; never raises."""
+    try:
+        request = build_claude_request(prompt, additional_context, system_prompt)
         agent_id = get_agent_id()
-        print(f"Agent {agent_id}: Calling Claude with prompt: {full_prompt[:50]}...")
-        resp = anthropic.messages.create(
-            model="claude-3-5-sonnet-20241022",
-            max_tokens=512,
-            messages=[{"role": "user", "content": full_prompt}],
-            system=system,
-        )
-        response_text = resp.content[0].text
+        full_prompt = request["messages"][0]["content"]
+        response_text = completion_cache.get(request, conversation_id)
+        if response_text is not None:
+            print(f"Agent {agent_id}: Claude response served from cache")
+        else:
+            print(f"Agent {agent_id}: Calling Claude with prompt: {full_prompt[:50]}...")
+            if completion_cache.bypasses(conversation_id):
+                # no_cache conversations never take another caller's in-flight result
+                response_text = await _create_completion_async(request, conversation_id)
+            else:
+                response_text = await claude_flight.do_async(
+                    completion_key(request), _create_completion_async, request, conversation_id
+                )
 
         # Log the Claude response
         log_message(conversation_id, current_path, f"Claude {agent_id}", response_text)
 
         return response_text
-    except APIStatusError as e:
-        print(
-            f"Agent {agent_id}: Anthropic API error:",
-            e.status_code,
-            e.message,
-            flush=True,
-        )
-        # If we hit a credit limit error, return a fallback message
-        if "credit balance is too low" in str(e):
-            return f"Agent {agent_id} processed (API credit limit reached): {prompt}"
     except Exception as e:
-        print(f"Agent {agent_id}: Anthropic SDK error:", e, flush=True)
-        traceback.print_exc()
-    return None
+        return claude_error_fallback(e, prompt)
+
+
+async def call_claude_stream_async(
+    prompt: str,
+    additional_context: str,
+    conversation_id: str,
+    current_path: str,
+    system_prompt: str = None,
+):
+    """Yield Claude's response text as it is generated; never raises.
+
+    The complete response is logged once the stream finishes.
+    """
+    request = build_claude_request(prompt, additional_context, system_prompt)
+    agent_id = get_agent_id()
+    full_prompt = request["messages"][0]["content"]
+    cached = completion_cache.get(request, conversation_id)
+    if cached is not None:
+        print(f"Agent {agent_id}: Claude response served from cache")
+        yield cached
+        log_message(conversation_id, current_path, f"Claude {agent_id}", cached)
+        return
+
+    print(f"Agent {agent_id}: Streaming Claude with prompt: {full_prompt[:50]}...")
+    chunks = []
+    try:
+        async with get_async_anthropic().messages.stream(**request) as stream:
+            async for text in stream.text_stream:
+                chunks.append(text)
+                yield text
+        completion_cache.put(request, "".join(chunks), conversation_id)
+    except Exception as e:
+        fallback = claude_error_fallback(e, prompt)
+        if fallback and not chunks:
+            chunks.append(fallback)
+            yield fallback
+
+    if chunks:
+        # Log the Claude response
+        log_message(conversation_id, current_path, f"Claude {agent_id}", "".join(chunks))
 
 
 def call_claude_direct(message_text: str, system_prompt: str = None) -> Optional[str]:
@@ -295,14 +630,15 @@ def send_to_terminal(text, terminal_url, conversation_id, metadata=None):
     """Send a message to a terminal"""
     try:
         print(f"Sending message to {terminal_url}: {text[:50]}...")
-        terminal = A2AClient(terminal_url, timeout=30)
-        terminal.send_message_threaded(
+        a2a_dispatcher.submit(
+            terminal_url,
             Message(
                 role=MessageRole.USER,
                 content=TextContent(text=text),
                 conversation_id=conversation_id,
                 metadata=Metadata(custom_fields=metadata or {}),
-            )
+            ),
+            timeout=30,
         )
         return True
     except Exception as e:
@@ -311,39 +647,9 @@ def send_to_terminal(text, terminal_url, conversation_id, metadata=None):
 
 
 def send_to_ui_client(message_text, from_agent, conversation_id):
-    # Read UI_CLIENT_URL dynamically to get the latest value
-    ui_client_url = os.getenv("UI_CLIENT_URL", "")
-    print(f"🔍 Dynamic UI_CLIENT_URL: '{ui_client_url}'")
-
-    if not ui_client_url:
-        print(f"No UI client URL configured. Cannot send message to UI client")
-        return False
-
-    try:
-        print(f"Sending message to UI client: {message_text[:50]}...")
-        response = requests.post(
-            ui_client_url,
-            json={
-                "message": message_text,
-                "from_agent": from_agent,
-                "conversation_id": conversation_id,
-                "timestamp": datetime.now().isoformat(),
-            },
-            timeout=10,
-            verify=False,  # add this line to disable SSL verification
-        )
-
-        if response.status_code == 200:
-            print(f"Successfully sent message to UI client")
-            return True
-        else:
-            print(
-                f"Failed to send message to UI client: {response.status_code} {response.text}"
-            )
-            return False
-    except Exception as e:
-        print(f"Error sending to UI client: {e}")
-        return False
+    """Queue a message for every registered UI client without waiting for delivery"""
+    print(f"Queueing message for UI clients: {message_text[:50]}...")
+    return registered_ui_clients.publish(message_text, from_agent, conversation_id) > 0
 
 
 def send_to_agent(target_agent_id, message_text, conversation_id, metadata=None):
@@ -388,8 +694,8 @@ def send_to_agent(target_agent_id, message_text, conversation_id, metadata=None)
         # Send message to the target agent's bridge
         # target_bridge_url = target_bridge_url.rstrip("/a2a")
         # print(f"Target bridge URL: {target_bridge_url}")
-        bridge_client = A2AClient(target_bridge_url, timeout=30)
-        response = bridge_client.send_message(
+        response = a2a_pool.send_message(
+            target_bridge_url,
             Message(
                 role=MessageRole.USER,
                 content=TextContent(text=formatted_message),
@@ -397,12 +703,19 @@ def send_to_agent(target_agent_id, message_text, conversation_id, metadata=None)
                 metadata=(
                     Metadata(custom_fields=send_metadata) if send_metadata else None
                 ),
-            )
+            ),
+            timeout=30,
         )
 
+        if isinstance(response.content, ErrorContent):
+            # The cached URL may be stale - resolve it again next time
+            invalidate_agent_lookup(target_agent_id)
+            return f"Error sending message to {target_agent_id}: {response.content.message}"
+
         return f"Message sent to {target_agent_id}"
     except Exception as e:
         print(f"Error sending message to {target_agent_id}: {e}")
+        invalidate_agent_lookup(target_agent_id)
         return f"Error sending message to {target_agent_id}: {e}"
 
 
@@ -410,6 +723,8 @@ def get_mcp_server_url(requested_registry: str, qualified_name: str) -> Optional
     """
     Query registry endpoint to find MCP server URL based on qualifiedName.
 
+    Concurrent lookups for the same server share one registry request.
+
     Args:
         requested_registry (str): The registry provider to search in
         qualified_name (str): The qualifiedName to search for (e.g. "@opgginc/opgg-mcp")
@@ -417,6 +732,15 @@ def get_mcp_server_url(requested_registry: str, qualified_name: str) -> Optional
     Returns:
         Optional[tuple]: Tuple of (endpoint, config_json, registry_name) if found, None otherwise
     """
+    return registry_flight.do(
+        ("mcp", requested_registry, qualified_name),
+        _fetch_mcp_server_url,
+        requested_registry,
+        qualified_name,
+    )
+
+
+def _fetch_mcp_server_url(requested_registry: str, qualified_name: str):
     try:
         registry_url = get_registry_url()
         endpoint_url = f"{registry_url}/get_mcp_registry"
@@ -424,8 +748,9 @@ def get_mcp_server_url(requested_registry: str, qualified_name: str) -> Optional
         print(f"Querying MCP registry endpoint: {endpoint_url} for {qualified_name}")
 
         # Make request to the registry endpoint
-        response = requests.get(
+        response = registry_client.get(
             endpoint_url,
+            "get_mcp_registry",
             params={
                 "registry_provider": requested_registry,
                 "qualified_name": qualified_name,
@@ -453,6 +778,20 @@ def get_mcp_server_url(requested_registry: str, qualified_name: str) -> Optional
         return None
 
 
+async def send_to_agent_async(
+    target_agent_id, message_text, conversation_id, metadata=None
+):
+    """Awaitable send_to_agent; the blocking registry and A2A calls run in a worker thread"""
+    return await run_blocking(
+        send_to_agent, target_agent_id, message_text, conversation_id, metadata
+    )
+
+
+async def get_mcp_server_url_async(requested_registry: str, qualified_name: str):
+    """Awaitable get_mcp_server_url"""
+    return await run_blocking(get_mcp_server_url, requested_registry, qualified_name)
+
+
 def form_mcp_server_url(url: str, config: dict, registry_name: str) -> Optional[str]:
     """
     Form the MCP server URL based on the URL and config.
@@ -506,11 +845,8 @@ async def run_mcp_query(query: str, updated_url: str) -> str:
 if not hasattr(A2AClient, "send_message_threaded"):
 
     def send_message_threaded(self, message: Message):
-        """Send a message in a separate thread without waiting for a response"""
-        thread = threading.Thread(target=self.send_message, args=(message,))
-        thread.daemon = True
-        thread.start()
-        return thread
+        """Queue a message on the shared dispatcher; returns a delivery Future"""
+        return a2a_dispatcher.submit(self.endpoint_url, message, self.timeout)
 
     # Add the method to the class
     A2AClient.send_message_threaded = send_message_threaded
@@ -573,8 +909,8 @@ def handle_external_message(msg_text, conversation_id, msg):
         # Otherwise, forward to local terminal (original behavior
         else:
             try:
-                terminal_client = A2AClient(LOCAL_TERMINAL_URL, timeout=10)
-                terminal_client.send_message_threaded(
+                a2a_dispatcher.submit(
+                    LOCAL_TERMINAL_URL,
                     Message(
                         role=MessageRole.USER,
                         content=TextContent(text=formatted_text),
@@ -587,7 +923,8 @@ def handle_external_message(msg_text, conversation_id, msg):
                                 "forwarded_by_bridge": True,
                             }
                         ),
-                    )
+                    ),
+                    timeout=10,
                 )
 
                 # Acknowledge receipt to sender
@@ -618,20 +955,42 @@ def handle_external_message(msg_text, conversation_id, msg):
 message_improvement_decorators = {}
 
 
-def message_improver(name=None):
-    """Decorator to register message improvement functions"""
+def _wrap_improver(name, func, cache, max_entries, ttl, normalize):
+    if not cache:
+        return func
+    return MemoizedImprover(
+        func, name=name, max_entries=max_entries, ttl=ttl, normalize=normalize
+    )
+
+
+def message_improver(
+    name=None, cache=False, max_entries=256, ttl=None, normalize=None
+):
+    """Decorator to register message improvement functions
+
+    With ``cache=True`` the registered improver memoizes its output per input
+    text (up to ``max_entries``, for ``ttl`` seconds if given). ``normalize``
+    ("strip", "whitespace", "casefold", a list of these or a callable) maps
+    messages to cache keys.
+    """
 
     def decorator(func):
         decorator_name = name or func.__name__
-        message_improvement_decorators[decorator_name] = func
+        message_improvement_decorators[decorator_name] = _wrap_improver(
+            decorator_name, func, cache, max_entries, ttl, normalize
+        )
         return func
 
     return decorator
 
 
-def register_message_improver(name, improver_func):
-    """Register a custom message improver function"""
-    message_improvement_decorators[name] = improver_func
+def register_message_improver(
+    name, improver_func, cache=False, max_entries=256, ttl=None, normalize=None
+):
+    """Register a custom message improver function; caching options as in message_improver"""
+    message_improvement_decorators[name] = _wrap_improver(
+        name, improver_func, cache, max_entries, ttl, normalize
+    )
 
 
 def get_message_improver(name):
@@ -644,6 +1003,18 @@ def list_message_improvers():
     return list(message_improvement_decorators.keys())
 
 
+def get_improver_cache_stats(name=None):
+    """Return cache stats for one memoized improver, or for all of them by name"""
+    if name is not None:
+        improver = message_improvement_decorators.get(name)
+        return improver.stats() if isinstance(improver, MemoizedImprover) else None
+    return {
+        improver_name: improver.stats()
+        for improver_name, improver in message_improvement_decorators.items()
+        if isinstance(improver, MemoizedImprover)
+    }
+
+
 # Default improver
 @message_improver("default_claude")
 def default_claude_improver(message_text: str) -> str:
@@ -663,12 +1034,27 @@ def default_claude_improver(message_text: str) -> str:
         return message_text
 
 
+def _is_admin_request(request):
+    """Return True for loopback callers and callers presenting BRIDGE_ADMIN_TOKEN"""
+    try:
+        if ipaddress.ip_address(request.remote_addr or "").is_loopback:
+            return True
+    except ValueError:
+        pass
+    if not BRIDGE_ADMIN_TOKEN:
+        return False
+    supplied = request.headers.get("Authorization", "")
+    return hmac.compare_digest(supplied.encode(), f"Bearer {BRIDGE_ADMIN_TOKEN}".encode())
+
+
 class AgentBridge(A2AServer):
     """Global Agent Bridge - Can be used for any agent in the network."""
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.active_improver = "default_claude"  # Default improver
+        # Load the agent directory in the background so lookups can use it
+        agent_directory.start()
 
     def set_message_improver(self, improver_name):
         """Set the active message improver by name"""
@@ -682,20 +1068,31 @@ class AgentBridge(A2AServer):
             )
             return False
 
-    def set_custom_improver(self, improver_func, name="custom"):
-        """Set a custom improver function"""
-        register_message_improver(name, improver_func)
+    def set_custom_improver(self, improver_func, name="custom", **cache_options):
+        """Set a custom improver function; ``cache_options`` as in register_message_improver"""
+        register_message_improver(name, improver_func, **cache_options)
         self.active_improver = name
         print(f"Custom message improver '{name}' registered and activated")
 
-    def improve_message_direct(self, message_text: str) -> str:
-        """Improve a message using the active registered improver."""
+    def improve_message_direct(self, message_text: str, fresh: bool = False) -> str:
+        """Improve a message using the active registered improver.
+
+        ``fresh`` (for no_cache conversations) skips memoized output and
+        never shares a concurrent caller's result.
+        """
         # Get the active improver function
         improver_func = message_improvement_decorators.get(self.active_improver)
 
         if improver_func:
             try:
-                return improver_func(message_text)
+                if fresh:
+                    if isinstance(improver_func, MemoizedImprover):
+                        return improver_func.uncached(message_text)
+                    return improver_func(message_text)
+                # Identical messages improved concurrently share one call
+                return improver_flight.do(
+                    (self.active_improver, message_text), improver_func, message_text
+                )
             except Exception as e:
                 print(f"Error with improver '{self.active_improver}': {e}")
                 return message_text
@@ -703,7 +1100,204 @@ class AgentBridge(A2AServer):
             print(f"No improver found: {self.active_improver}")
             return message_text
 
+    def setup_routes(self, app):
+        """python_a2a hook: add UI client registration and /stats endpoints to the bridge app
+
+        Also replaces python_a2a's POST /stream view, which can drop chunks,
+        so every way of starting the bridge streams correctly.
+        """
+        from flask import jsonify, request
+
+        add_stream_route(app, self)
+
+        def admin_only(view):
+            def guarded(*args, **kwargs):
+                if not _is_admin_request(request):
+                    return jsonify({"error": "forbidden"}), 403
+                return view(*args, **kwargs)
+
+            guarded.__name__ = view.__name__
+            return guarded
+
+        @app.route("/ui_clients/register", methods=["POST"])
+        @admin_only
+        def register_ui_client():
+            data = request.get_json(silent=True) or {}
+            url = data.get("url", "")
+            if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+                return jsonify({"error": "url must be an http(s) URL"}), 400
+            options = {}
+            try:
+                if "max_pending" in data:
+                    options["max_pending"] = min(int(data["max_pending"]), UI_CLIENT_MAX_PENDING)
+                if "workers" in data:
+                    options["workers"] = min(int(data["workers"]), UI_CLIENT_MAX_WORKERS)
+                if "overflow" in data:
+                    options["overflow"] = str(data["overflow"])
+                registered_ui_clients.register(url, **options)
+            except (TypeError, ValueError) as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({"registered": url, "clients": registered_ui_clients.urls()})
+
+        @app.route("/ui_clients/deregister", methods=["POST"])
+        @admin_only
+        def deregister_ui_client():
+            data = request.get_json(silent=True) or {}
+            url = data.get("url", "")
+            if not registered_ui_clients.deregister(url):
+                return jsonify({"error": f"UI client {url} is not registered"}), 404
+            return jsonify({"deregistered": url, "clients": registered_ui_clients.urls()})
+
+        @app.route("/ui_clients", methods=["GET"])
+        @admin_only
+        def list_ui_clients():
+            return jsonify(get_ui_client_stats())
+
+        @app.route("/stats", methods=["GET"])
+        @admin_only
+        def bridge_stats():
+            return jsonify(get_bridge_stats())
+
+    def conversation_lock(self, conversation_id):
+        """Lock a conversation's shared state against other worker processes
+
+        Only taken when worker processes share state. Callers hold it just
+        while they update that state, never across model calls or sends: two
+        bridges messaging each other in one conversation would otherwise wait
+        on each other's locks.
+        """
+        if not conversation_id or not state_backend.shared:
+            return contextlib.nullcontext()
+        return state_backend.conversation_lock(conversation_id, CONVERSATION_LOCK_TIMEOUT)
+
+    def _log_incoming_locked(self, conversation_id, path, source, text):
+        with self.conversation_lock(conversation_id):
+            log_message(conversation_id, path, source, text)
+
+    async def log_incoming(self, conversation_id, path, source, text):
+        """Log a message received by this agent in arrival order for its conversation"""
+        if state_backend.shared:
+            # Waiting for another worker's ticket blocks, so keep it off the loop
+            await run_blocking(self._log_incoming_locked, conversation_id, path, source, text)
+        else:
+            log_message(conversation_id, path, source, text)
+
     def handle_message(self, msg: Message) -> Message:
+        """Synchronous entry point for python_a2a; runs the async pipeline on the bridge loop
+
+        The server thread that called it stays blocked until the response is
+        ready, so each in-flight request still occupies one server thread.
+        """
+        return run_sync(self.handle_message_async(msg))
+
+    async def _pump_stream(self, msg: Message, put):
+        """Feed stream_message_async chunks to ``put``; ends with an error or None"""
+        try:
+            async for chunk in self.stream_message_async(msg):
+                put(chunk)
+        except Exception as e:
+            put(e)
+        finally:
+            put(None)
+
+    def stream_message(self, msg: Message):
+        """Yield response chunks to a synchronous caller (e.g. a Flask view)"""
+        chunks = queue.Queue()
+        future = bridge_loop.submit(self._pump_stream(msg, chunks.put))
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            future.cancel()
+
+    async def stream_response(self, message: Message):
+        """python_a2a stream hook: relay stream_message_async from the bridge loop.
+
+        python_a2a drives this generator on a throwaway loop in its own thread,
+        so chunks are produced on the bridge loop (where the shared async
+        clients live) and handed over through a queue.
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        future = bridge_loop.submit(
+            self._pump_stream(
+                message, lambda item: loop.call_soon_threadsafe(chunks.put_nowait, item)
+            )
+        )
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            future.cancel()
+
+    async def stream_message_async(self, msg: Message):
+        """Yield the response to a message incrementally.
+
+        Regular messages answered by Claude and /query commands stream tokens
+        as they are generated; every other message falls back to
+        handle_message_async and yields its full text once.
+        """
+        conversation_id = msg.conversation_id or str(uuid.uuid4())
+        agent_id = get_agent_id()
+        if hasattr(msg.metadata, "custom_fields"):
+            metadata = msg.metadata.custom_fields or {}
+        else:
+            metadata = msg.metadata or {}
+        path = metadata.get("path", "")
+        current_path = path + (">" if path else "") + agent_id
+        additional_context = metadata.get("additional_context", "")
+        if metadata.get("no_cache"):
+            completion_cache.bypass_conversation(conversation_id)
+
+        user_text = msg.content.text if isinstance(msg.content, TextContent) else None
+        prompt = None
+        if (
+            user_text is not None
+            and not metadata.get("is_from_peer", False)
+            and not user_text.startswith(("__EXTERNAL_MESSAGE__", "@", "#"))
+        ):
+            if user_text.startswith("/query ") and user_text[7:].strip():
+                prompt, system_prompt = user_text.split(" ", 1)[1], QUERY_SYSTEM_PROMPT
+                empty_response = "Sorry, I couldn't process your query. Please try again."
+            elif not user_text.startswith("/") and self.active_improver in (
+                None,
+                "default_claude",
+            ):
+                prompt, system_prompt = user_text, None
+                empty_response = user_text
+
+        if prompt is None:
+            response = await self.handle_message_async(msg)
+            if isinstance(response.content, TextContent):
+                yield response.content.text
+            else:
+                yield f"Error: {getattr(response.content, 'message', response.content)}"
+            return
+
+        await self.log_incoming(
+            conversation_id, current_path, f"Local user to Agent {agent_id}", user_text
+        )
+        yield f"[AGENT {agent_id}] "
+        streamed = False
+        async for chunk in call_claude_stream_async(
+            prompt, additional_context, conversation_id, current_path, system_prompt
+        ):
+            streamed = True
+            yield chunk
+        if not streamed:
+            yield empty_response
+
+    async def handle_message_async(self, msg: Message) -> Message:
         # Ensure we have a conversation ID
         conversation_id = msg.conversation_id or str(uuid.uuid4())
         agent_id = get_agent_id()
@@ -733,6 +1327,9 @@ class AgentBridge(A2AServer):
         )  # Check if this is an external message
         from_agent = metadata.get("from_agent_id", "unknown")
         additional_context = metadata.get("additional_context", "")
+        if metadata.get("no_cache"):
+            # Client asked for fresh completions for this whole conversation
+            completion_cache.bypass_conversation(conversation_id)
 
         # Add current agent ID to the path
         agent_id = get_agent_id()
@@ -751,7 +1348,9 @@ class AgentBridge(A2AServer):
 
         if user_text.startswith("__EXTERNAL_MESSAGE__"):
             print("--- External Message Detected ---")
-            external_response = handle_external_message(user_text, conversation_id, msg)
+            external_response = await run_blocking(
+                handle_external_message, user_text, conversation_id, msg
+            )
             if external_response:
                 return external_response
 
@@ -768,7 +1367,7 @@ class AgentBridge(A2AServer):
             )
         else:
             # Message from local terminal user
-            log_message(
+            await self.log_incoming(
                 conversation_id,
                 current_path,
                 f"Local user to Agent {agent_id}",
@@ -787,7 +1386,11 @@ class AgentBridge(A2AServer):
                     if IMPROVE_MESSAGES:
                         # message_text = improve_message(message_text, conversation_id, current_path,
                         #     "Do not respond to the content of the message - it's intended for another agent. You are helping an agent communicate better with other agents.")
-                        message_text = self.improve_message_direct(message_text)
+                        message_text = await run_blocking(
+                            self.improve_message_direct,
+                            message_text,
+                            completion_cache.bypasses(conversation_id),
+                        )
                         log_message(
                             conversation_id,
                             current_path,
@@ -798,7 +1401,7 @@ class AgentBridge(A2AServer):
                     print(f"#jinu - Target agent: {target_agent}")
                     print(f"#jinu - Imoproved message text: {message_text}")
                     # Send to the target agent's bridge
-                    result = send_to_agent(
+                    result = await send_to_agent_async(
                         target_agent,
                         message_text,
                         conversation_id,
@@ -835,7 +1438,7 @@ class AgentBridge(A2AServer):
                         f"Requested registry: {requested_registry}, MCP server to call: {mcp_server_to_call}, query: {query}"
                     )
                     # Get the MCP server URL and config details
-                    response = get_mcp_server_url(
+                    response = await get_mcp_server_url_async(
                         requested_registry, mcp_server_to_call
                     )
                     print("Response from get_mcp_server_url: ", response)
@@ -868,7 +1471,7 @@ class AgentBridge(A2AServer):
                             conversation_id=conversation_id,
                         )
                     print(f"Running MCP query: {query} on {mcp_server_final_url}")
-                    result = asyncio.run(run_mcp_query(query, mcp_server_final_url))
+                    result = await run_mcp_query(query, mcp_server_final_url)
 
                     print(f"# Result from MCP query: {result}")
                     return Message(
@@ -928,12 +1531,12 @@ class AgentBridge(A2AServer):
                         print(f"Processing query command: '{query_text}'")
 
                         # Call Claude with the query
-                        claude_response = call_claude(
+                        claude_response = await call_claude_async(
                             query_text,
                             additional_context,
                             conversation_id,
                             current_path,
-                            "You are Claude, an AI assistant. Provide a direct, helpful response to the user's question. Treat it as a private request for guidance and respond only to the user.",
+                            QUERY_SYSTEM_PROMPT,
                         )
 
                         # Make sure we have a valid response
@@ -989,11 +1592,18 @@ class AgentBridge(A2AServer):
                 # Use custom improvement logic if available, otherwise fall back to call_claude
                 if self.active_improver and self.active_improver != "default_claude":
                     print(f"#jinu - Using custom improver: {self.active_improver}")
-                    improved_response = self.improve_message_direct(user_text) or user_text
+                    improved_response = (
+                        await run_blocking(
+                            self.improve_message_direct,
+                            user_text,
+                            completion_cache.bypasses(conversation_id),
+                        )
+                        or user_text
+                    )
                 else:
                     print(f"#jinu - Using default Claude")
                     improved_response = (
-                        call_claude(
+                        await call_claude_async(
                             user_text, additional_context, conversation_id, current_path
                         )
                         or user_text
@@ -1036,4 +1646,11 @@ if __name__ == "__main__":
         f"Message improvement feature is {'ENABLED' if IMPROVE_MESSAGES else 'DISABLED'}"
     )
     print(f"Logging conversations to {os.path.abspath(LOG_DIR)}")
-    run_server(AgentBridge(), host="0.0.0.0", port=PORT)
+    serving = serving_options()
+    serve_agent(
+        AgentBridge(),
+        host="0.0.0.0",
+        port=PORT,
+        options=serving,
+        shared_state=use_shared_state(serving["workers"]),
+    )
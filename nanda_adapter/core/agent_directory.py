@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Locally cached agent directory
+
+The registry's agent listing is fetched by a background thread every
+``refresh_interval`` seconds (conditionally, with ``If-None-Match`` when the
+registry sends ETags) and kept as a snapshot sorted by agent id.
+Callers page through it, search by agent id prefix and look single agents up
+without touching the registry; each snapshot carries its own ETag and
+pre-encoded (and gzipped) JSON body for the unpaginated listing.
+
+A directory can also be saved to SQLite so it is warm after a restart and
+keeps answering while the registry is down, and can follow a registry
+changes feed instead of refetching the whole listing (see AgentDirectory).
+"""
+
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+# Responses smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+
+def listing_entries(listing):
+    """Return ``[(agent_id, entry)]`` for a registry listing.
+
+    Accepts a list of agent ids or agent dicts, or a dict keyed by agent id.
+    """
+    if isinstance(listing, dict) and isinstance(listing.get("agents"), (list, dict)):
+        listing = listing["agents"]
+    entries = []
+    if isinstance(listing, dict):
+        for agent_id, value in listing.items():
+            entries.append((str(agent_id), value))
+    elif isinstance(listing, list):
+        for entry in listing:
+            if isinstance(entry, dict):
+                agent_id = entry.get("agent_id") or entry.get("id") or ""
+            else:
+                agent_id = entry
+            entries.append((str(agent_id), entry))
+    return entries
+
+
+def gzip_body(body):
+    return gzip.compress(body, compresslevel=5)
+
+
+def normalize_entry(agent_id, entry):
+    """Return a listing entry as a dict carrying its agent_id"""
+    if isinstance(entry, dict):
+        return dict(entry, agent_id=agent_id)
+    if isinstance(entry, str) and entry and entry != agent_id:
+        # {agent_id: agent_url} listings
+        return {"agent_id": agent_id, "agent_url": entry}
+    return {"agent_id": agent_id}
+
+
+def apply_listing_changes(listing, upserts, removals):
+    """Return a copy of ``listing`` with agents upserted and removed.
+
+    ``upserts`` maps agent ids to agent dicts; entries are written in the
+    listing's own shape (agent dicts, bare agent ids, or agent_id -> url).
+    """
+    if isinstance(listing, dict) and isinstance(listing.get("agents"), (list, dict)):
+        return dict(listing, agents=apply_listing_changes(listing["agents"], upserts, removals))
+    if isinstance(listing, dict):
+        plain = any(not isinstance(value, dict) for value in listing.values())
+        updated = {k: v for k, v in listing.items() if k not in removals}
+        for agent_id, entry in upserts.items():
+            updated[agent_id] = entry.get("agent_url") if plain else entry
+        return updated
+    listing = listing if isinstance(listing, list) else []
+    plain = any(not isinstance(entry, dict) for entry in listing)
+    updated, seen = [], set()
+    for agent_id, entry in listing_entries(listing):
+        if agent_id in removals:
+            continue
+        if agent_id in upserts:
+            seen.add(agent_id)
+            entry = agent_id if plain else upserts[agent_id]
+        updated.append(entry)
+    for agent_id, entry in upserts.items():
+        if agent_id not in seen:
+            updated.append(agent_id if plain else entry)
+    return updated
+
+
+class DirectorySnapshot:
+    """One version of the directory listing, sorted by agent id"""
+
+    def __init__(self, listing, fetched_at, registry_etag=None):
+        self.listing = listing
+        self.fetched_at = fetched_at
+        self.registry_etag = registry_etag
+        entries = sorted(listing_entries(listing), key=lambda item: item[0].lower())
+        self.keys = [agent_id.lower() for agent_id, _ in entries]
+        self.entries = [entry for _, entry in entries]
+        self.by_id = dict(entries)
+        self.body = json.dumps(listing, separators=(",", ":")).encode("utf-8")
+        self.etag = hashlib.sha1(self.body).hexdigest()[:20]
+        self._gzip = None
+
+    @property
+    def gzip_body(self):
+        if self._gzip is None:
+            self._gzip = gzip_body(self.body)
+        return self._gzip
+
+    def search(self, prefix="", offset=0, limit=50):
+        """Return ``(entries, total)`` for agents whose id starts with ``prefix``"""
+        prefix = prefix.lower()
+        if prefix:
+            start = bisect.bisect_left(self.keys, prefix)
+            end = bisect.bisect_left(self.keys, prefix + "\uffff")
+        else:
+            start, end = 0, len(self.keys)
+        total = end - start
+        first = start + max(0, offset)
+        return self.entries[first : min(end, first + max(0, limit))], total
+
+    def get(self, agent_id):
+        """Return an agent's entry as a dict, or None"""
+        if agent_id not in self.by_id:
+            return None
+        return normalize_entry(agent_id, self.by_id[agent_id])
+
+    def agent_url(self, agent_id):
+        entry = self.get(agent_id)
+        return entry.get("agent_url") if entry else None
+
+    def changed_ids(self, previous):
+        """Return the agent ids added, removed or modified since ``previous``"""
+        if previous is None:
+            return set(self.by_id)
+        ids = self.by_id.keys() | previous.by_id.keys()
+        return {a for a in ids if self.by_id.get(a) != previous.by_id.get(a)}
+
+
+class _SnapshotStore:
+    """SQLite copy of a directory's listing so it can be warm-loaded after a restart
+
+    Like the bridge's other SQLite stores it reconnects in forked children.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # Called with self._lock held
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS directory (key TEXT PRIMARY KEY, value TEXT)"
+                )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def load(self):
+        """Return the stored state (listing, fetched_at, registry_etag, cursor), or {}"""
+        with self._lock:
+            rows = self._connection().execute("SELECT key, value FROM directory").fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def save(self, **state):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO directory VALUES (?, ?)",
+                    [(key, json.dumps(value)) for key, value in state.items()],
+                )
+
+
+class AgentDirectory:
+    """Registry agent listing cached locally with periodic conditional refresh.
+
+    With ``db_path`` the listing is saved to SQLite after every change and
+    loaded from there at startup.
+
+    ``changes_path`` opts in to incremental refreshes, for registries that
+    offer a changes feed. It is feature-detected: the feed is only used after
+    a full listing response advertised a cursor in the ``X-Registry-Cursor``
+    header, and is then requested as ``GET <changes_path>?since=<cursor>``,
+    answering ``{"changes": [agent, ...], "cursor": ...}`` (agents flagged
+    ``"deleted": true`` are removed). Without the header, or once the feed
+    answers 404, 405 or 501, the directory falls back to conditional full
+    listings for the rest of the process.
+    """
+
+    CURSOR_HEADER = "X-Registry-Cursor"
+
+    def __init__(
+        self,
+        registry_client,
+        get_registry_url,
+        refresh_interval=30.0,
+        endpoints=(("clients", "/clients"), ("list", "/list")),
+        request_kwargs=None,
+        on_change=None,
+        db_path=None,
+        changes_path=None,
+    ):
+        self.registry_client = registry_client
+        self.get_registry_url = get_registry_url
+        self.refresh_interval = refresh_interval
+        self.endpoints = endpoints
+        self.request_kwargs = request_kwargs or {}
+        # ``on_change(listing, changed_ids)`` runs after a new listing has been installed
+        self.on_change = on_change
+        self.changes_path = changes_path
+        self._snapshot = None
+        self._cursor = None
+        # None until the registry has shown whether it supports the changes feed
+        self._incremental = None if changes_path else False
+        self._refreshed = False
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stats = {
+            "refreshes": 0,
+            "incremental_refreshes": 0,
+            "not_modified": 0,
+            "changed": 0,
+            "errors": 0,
+            "warm_loaded": 0,
+        }
+        self._store = None
+        if db_path:
+            try:
+                self._store = _SnapshotStore(db_path)
+                self._warm_load()
+            except Exception as e:
+                print(f"Agent directory snapshot disabled ({db_path}): {e}")
+                self._store = None
+
+    def _warm_load(self):
+        state = self._store.load()
+        if "listing" not in state:
+            return
+        self._snapshot = DirectorySnapshot(
+            state["listing"], state.get("fetched_at", 0.0), state.get("registry_etag")
+        )
+        self._cursor = state.get("cursor")
+        self._stats["warm_loaded"] = len(self._snapshot.entries)
+        print(
+            f"Loaded {len(self._snapshot.entries)} agents from agent directory "
+            f"snapshot {self._store.path}"
+        )
+
+    def _fetch(self, headers):
+        reg_url = self.get_registry_url()
+        last_error = None
+        for label, path in self.endpoints:
+            try:
+                response = self.registry_client.get(
+                    f"{reg_url}{path}", label, headers=headers, **self.request_kwargs
+                )
+            except requests.RequestException as e:
+                last_error = e
+                continue
+            if response.status_code == 404:
+                last_error = RuntimeError(f"{path} returned 404")
+                continue
+            return response
+        raise last_error or RuntimeError("no registry listing endpoint configured")
+
+    def _fetch_listing(self, current):
+        """Return ``(snapshot, cursor)``; ``current`` itself if it is unchanged"""
+        headers = {}
+        if current is not None and current.registry_etag:
+            headers["If-None-Match"] = current.registry_etag
+        response = self._fetch(headers)
+        if response.status_code == 304 and current is not None:
+            with self._lock:
+                self._stats["not_modified"] += 1
+            current.fetched_at = time.time()
+            return current, self._cursor
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"registry returned {response.status_code}: {response.text[:200]}"
+            )
+        snapshot = DirectorySnapshot(response.json(), time.time(), response.headers.get("ETag"))
+        return snapshot, response.headers.get(self.CURSOR_HEADER)
+
+    def _fetch_changes(self, current):
+        """Return ``(snapshot, cursor)``, or ``(None, None)`` without a changes feed"""
+        response = self.registry_client.get(
+            f"{self.get_registry_url()}{self.changes_path}",
+            "list_changes",
+            params={"since": self._cursor},
+            **self.request_kwargs,
+        )
+        if response.status_code in (404, 405, 501):
+            print("Registry has no changes feed; agent directory will refetch full listings")
+            self._incremental = False
+            return None, None
+        if response.status_code != 200:
+            raise RuntimeError(f"changes feed returned {response.status_code}")
+        data = response.json()
+        upserts, removals = {}, set()
+        for agent_id, entry in listing_entries(data.get("changes", [])):
+            if not agent_id:
+                continue
+            if isinstance(entry, dict) and entry.get("deleted"):
+                removals.add(agent_id)
+                upserts.pop(agent_id, None)
+            else:
+                upserts[agent_id] = normalize_entry(agent_id, entry)
+                removals.discard(agent_id)
+        self._incremental = True
+        with self._lock:
+            self._stats["incremental_refreshes"] += 1
+        cursor = data.get("cursor", self._cursor)
+        if not upserts and not removals:
+            current.fetched_at = time.time()
+            return current, cursor
+        listing = apply_listing_changes(current.listing, upserts, removals)
+        # The registry's ETag described the listing before these changes
+        return DirectorySnapshot(listing, time.time()), cursor
+
+    def refresh(self):
+        """Fetch the listing now; returns True if the directory changed"""
+        with self._refresh_lock:
+            current = self._snapshot
+            try:
+                snapshot = None
+                if current is not None and self._incremental is not False and self._cursor:
+                    snapshot, cursor = self._fetch_changes(current)
+                if snapshot is None:
+                    snapshot, cursor = self._fetch_listing(current)
+            except Exception as e:
+                with self._lock:
+                    self._stats["errors"] += 1
+                print(f"Error refreshing agent directory: {e}")
+                if current is None:
+                    raise
+                return False
+
+            changed = current is None or snapshot.etag != current.etag
+            with self._lock:
+                self._stats["refreshes"] += 1
+                cursor_changed = cursor != self._cursor
+                self._cursor = cursor
+                self._refreshed = True
+                if changed:
+                    self._stats["changed"] += 1
+                    self._snapshot = snapshot
+                elif snapshot is not current:
+                    current.fetched_at = snapshot.fetched_at
+                    current.registry_etag = snapshot.registry_etag
+            if self._store is not None and (changed or cursor_changed):
+                try:
+                    self._store.save(
+                        listing=snapshot.listing,
+                        fetched_at=snapshot.fetched_at,
+                        registry_etag=snapshot.registry_etag,
+                        cursor=cursor,
+                    )
+                except Exception as e:
+                    print(f"Error writing agent directory snapshot: {e}")
+            if changed and self.on_change is not None:
+                try:
+                    self.on_change(snapshot.listing, snapshot.changed_ids(current))
+                except Exception as e:
+                    print(f"Error in agent directory change hook: {e}")
+            return changed
+
+    def _ensure_started(self):
+        # Threads do not survive fork: a forked worker starts its own
+        if self.refresh_interval <= 0 or (
+            self._thread is not None and self._thread_pid == os.getpid()
+        ):
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid():
+                self._thread = threading.Thread(
+                    target=self._run, name="agent-directory-refresh", daemon=True
+                )
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def start(self):
+        """Start refreshing in the background (the first refresh runs right away)"""
+        self._ensure_started()
+
+    def _run(self):
+        # A warm-loaded listing has not been refreshed yet: do that right away
+        delay = self.refresh_interval if self._refreshed else 0
+        while True:
+            time.sleep(delay)
+            delay = self.refresh_interval
+            try:
+                self.refresh()
+            except Exception:
+                pass
+
+    def snapshot(self):
+        """Return the current snapshot, loading it on first use (may raise)"""
+        if self._snapshot is None:
+            self.refresh()
+        self._ensure_started()
+        return self._snapshot
+
+    def peek(self):
+        """Return the current snapshot (or None) without contacting the registry"""
+        return self._snapshot
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            snapshot = self._snapshot
+        stats["incremental"] = self._incremental
+        stats["persistent"] = self._store is not None
+        if snapshot is not None:
+            stats["agents"] = len(snapshot.entries)
+            stats["etag"] = snapshot.etag
+            stats["age_seconds"] = round(time.time() - snapshot.fetched_at, 1)
+        return stats
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Long-lived asyncio event loop for the agent bridge
+
+The loop runs in a daemon thread for the lifetime of the process, so async
+clients (Anthropic, MCP sessions) keep their connections between messages
+and synchronous server threads can hand coroutines to it instead of
+creating a new loop per request with ``asyncio.run``.
+
+Blocking calls (custom improvers, registry lookups, A2A sends) are awaited
+through ``run_blocking`` on the loop's own thread pool. It is sized by
+BRIDGE_BLOCKING_THREADS (default 64) rather than asyncio's min(32, cpus + 4),
+so slow peers do not queue behind each other on small machines.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BackgroundLoop:
+    """An asyncio event loop running forever in a daemon thread"""
+
+    def __init__(self, name="agent-bridge-loop", blocking_threads=64):
+        self.name = name
+        self.blocking_threads = blocking_threads
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """Return the running loop, starting its thread on first use"""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    ready = threading.Event()
+                    self._thread = threading.Thread(
+                        target=self._run, args=(ready,), name=self.name, daemon=True
+                    )
+                    self._thread.start()
+                    ready.wait()
+        return self._loop
+
+    def _run(self, ready):
+        loop = asyncio.new_event_loop()
+        loop.set_default_executor(
+            ThreadPoolExecutor(self.blocking_threads, thread_name_prefix=f"{self.name}-blocking")
+        )
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        ready.set()
+        loop.run_forever()
+
+    def in_loop_thread(self):
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop and return a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and block the calling thread for its result"""
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("BackgroundLoop.run() called from the loop thread; await instead")
+        return self.submit(coro).result(timeout)
+
+
+bridge_loop = BackgroundLoop(blocking_threads=int(os.getenv("BRIDGE_BLOCKING_THREADS", "64")))
+
+
+def run_sync(coro, timeout=None):
+    """Run a coroutine on the shared bridge loop from synchronous code"""
+    return bridge_loop.run(coro, timeout)
+
+
+async def run_blocking(func, *args):
+    """Await a blocking call run in the loop's thread pool
+
+    Equivalent to ``asyncio.to_thread``, which needs Python 3.9.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args))
@@ -1,8 +1,11 @@
 """
 Chat UI Patch for python_a2a
 Adds a working /tasks/send GET endpoint with a chat interface
+and a POST /stream endpoint that streams the agent's response
 """
 
+import json
+
 CHAT_UI_HTML = """
 <!DOCTYPE html>
 <html lang="en">
@@ -149,10 +152,69 @@ CHAT_UI_HTML = """
 
     <script>
         const API = '/a2a';
+        const STREAM_API = '/stream';
         const chat = document.getElementById('chat');
         const input = document.getElementById('input');
         const sendBtn = document.getElementById('send');
 
+        // Remove [AGENT default] prefix if present
+        const cleanText = text => text.replace(/^\\[AGENT default\\]\\s*/, '');
+
+        async function sendStreaming(msg) {
+            const res = await fetch(STREAM_API, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+                body: JSON.stringify({
+                    content: { type: 'text', text: msg },
+                    role: 'user'
+                })
+            });
+            if (!res.ok || !res.body) return false;
+
+            const content = addMsg('agent', '');
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let text = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\\n\\n');
+                buffer = events.pop();
+                for (const event of events) {
+                    const isError = event.startsWith('event: error');
+                    const data = event.split('\\n')
+                        .filter(line => line.startsWith('data: '))
+                        .map(line => line.slice(6))
+                        .join('\\n');
+                    if (!data) continue;
+                    const payload = JSON.parse(data);
+                    if (isError) throw new Error(payload.error || 'Stream error');
+                    if (payload.content) text += payload.content;
+                    content.textContent = cleanText(text);
+                    chat.scrollTop = chat.scrollHeight;
+                }
+            }
+            if (!text) content.textContent = 'No response';
+            return true;
+        }
+
+        async function sendOnce(msg) {
+            const res = await fetch(API, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    parts: [{ type: 'text', text: msg }],
+                    role: 'user'
+                })
+            });
+
+            const data = await res.json();
+            const text = data.parts?.[0]?.text || 'No response';
+            addMsg('agent', cleanText(text));
+        }
+
         async function send() {
             const msg = input.value.trim();
             if (!msg) return;
@@ -164,21 +226,8 @@ CHAT_UI_HTML = """
             input.disabled = true;
 
             try {
-                const res = await fetch(API, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        parts: [{ type: 'text', text: msg }],
-                        role: 'user'
-                    })
-                });
-
-                const data = await res.json();
-                const text = data.parts?.[0]?.text || 'No response';
-
-                // Remove [AGENT default] prefix if present
-                const cleanText = text.replace(/^\\[AGENT default\\]\\s*/, '');
-                addMsg('agent', cleanText);
+                // Render tokens as they arrive; fall back to a single request
+                if (!(await sendStreaming(msg))) await sendOnce(msg);
             } catch (e) {
                 addMsg('agent', 'Error: ' + e.message);
             }
@@ -194,6 +243,7 @@ CHAT_UI_HTML = """
             div.innerHTML = `<div class="message-content">${escapeHtml(text)}</div>`;
             chat.appendChild(div);
             chat.scrollTop = chat.scrollHeight;
+            return div.firstElementChild;
         }
 
         function escapeHtml(text) {
@@ -226,3 +276,50 @@ def add_chat_ui_route(app):
 
     print("✅ Added /tasks/send GET handler with chat UI")
     return app
+
+
+def add_stream_route(app, agent):
+    """
+    Serve POST /stream from ``agent.stream_message``
+
+    python_a2a's built-in /stream view stops reading its queue as soon as the
+    producer finishes, which can drop the final chunks. This view keeps the
+    same SSE event format but yields every chunk as it is produced.
+    """
+    from flask import Response, jsonify, request, stream_with_context
+    from python_a2a import Message
+
+    def stream_view():
+        try:
+            message = Message.from_dict(request.json or {})
+        except Exception as e:
+            return jsonify({"error": f"Invalid message: {e}"}), 400
+
+        def generate():
+            yield ": SSE stream established\n\n"
+            index = 0
+            try:
+                for chunk in agent.stream_message(message):
+                    event = {"content": chunk, "index": index, "append": True}
+                    yield f"data: {json.dumps(event)}\n\n"
+                    index += 1
+                event = {"content": "", "index": index, "append": True, "lastChunk": True}
+                yield f"data: {json.dumps(event)}\n\n"
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    for rule in app.url_map.iter_rules():
+        if rule.rule == "/stream" and "POST" in rule.methods:
+            app.view_functions[rule.endpoint] = stream_view
+            break
+    else:
+        app.add_url_rule("/stream", "stream", stream_view, methods=["POST"])
+
+    print("✅ Added /stream POST handler for token streaming")
+    return app
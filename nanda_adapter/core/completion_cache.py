@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Opt-in cache for Claude completions
+
+Responses are keyed by a hash of the full messages.create request (model,
+max_tokens, system prompt and the prompt with its additional context). A
+bounded in-memory LRU sits in front of an optional SQLite file so cached
+completions survive restarts. Conversations can opt out individually; opt-outs
+are remembered for ``bypass_ttl`` seconds after the conversation's last
+opted-out message, for at most ``bypass_maxsize`` conversations.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from ttl_cache import MISSING, TTLCache
+
+
+def completion_key(request):
+    """Return a stable hash of a messages.create request"""
+    payload = json.dumps(request, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _SQLiteTier:
+    """Completion store in a single SQLite table, pruned by last use
+
+    Each process opens its own connection on first use, so a cache created
+    before the bridge forks its workers is safe to use in all of them.
+    """
+
+    def __init__(self, path, max_entries=10000, prune_every=100):
+        self.path = path
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        with self._lock:
+            self._connection()
+
+    def _connection(self):
+        # Called with self._lock held
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS completions ("
+                    " key TEXT PRIMARY KEY, response TEXT NOT NULL,"
+                    " expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+                )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT response FROM completions WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row is not None:
+                with conn:
+                    conn.execute(
+                        "UPDATE completions SET last_used = ? WHERE key = ?", (now, key)
+                    )
+        return row[0] if row else None
+
+    def set(self, key, response, ttl):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)",
+                    (key, response, now + ttl, now),
+                )
+                self._writes += 1
+                if self._writes % self.prune_every == 0:
+                    self._prune(conn, now)
+
+    def _prune(self, conn, now):
+        conn.execute("DELETE FROM completions WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM completions WHERE key NOT IN ("
+            " SELECT key FROM completions ORDER BY last_used DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM completions")
+
+    def __len__(self):
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class CompletionCache:
+    """Two-tier (memory LRU + optional SQLite) cache of Claude responses"""
+
+    def __init__(
+        self,
+        enabled=False,
+        maxsize=1024,
+        ttl=3600.0,
+        db_path=None,
+        max_disk_entries=10000,
+        bypass_maxsize=10000,
+        bypass_ttl=86400.0,
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl, negative_ttl=0.0)
+        self._disk = None
+        if enabled and db_path:
+            try:
+                self._disk = _SQLiteTier(db_path, max_entries=max_disk_entries)
+            except Exception as e:
+                print(f"Completion cache: SQLite tier disabled ({db_path}): {e}")
+        # conversation_id -> True for conversations that opted out
+        self._bypassed = TTLCache(maxsize=bypass_maxsize, ttl=bypass_ttl, negative_ttl=0.0)
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "stores": 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def bypass_conversation(self, conversation_id, bypass=True):
+        """Skip the cache (reads and writes) for one conversation"""
+        if bypass:
+            self._bypassed.set(conversation_id, True)
+        else:
+            self._bypassed.invalidate(conversation_id)
+
+    def bypasses(self, conversation_id):
+        """Return True if a conversation opted out of cached or shared responses"""
+        value, _ = self._bypassed.get(conversation_id)
+        return value is True
+
+    def _skip(self, conversation_id):
+        return not self.enabled or self.bypasses(conversation_id)
+
+    def get(self, request, conversation_id=None):
+        """Return the cached response text for a request, or None"""
+        if self._skip(conversation_id):
+            if self.enabled:
+                self._count("bypassed")
+            return None
+        key = completion_key(request)
+        value, _ = self._memory.get(key)
+        if value is not MISSING:
+            self._count("memory_hits")
+            return value
+        if self._disk is not None:
+            try:
+                value = self._disk.get(key)
+            except Exception as e:
+                print(f"Completion cache: SQLite read failed: {e}")
+                value = None
+            if value is not None:
+                self._memory.set(key, value)
+                self._count("disk_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def put(self, request, response, conversation_id=None):
+        """Store a successful response for a request"""
+        if not response or self._skip(conversation_id):
+            return
+        key = completion_key(request)
+        self._memory.set(key, response)
+        if self._disk is not None:
+            try:
+                self._disk.set(key, response, self.ttl)
+            except Exception as e:
+                print(f"Completion cache: SQLite write failed: {e}")
+        self._count("stores")
+
+    def clear(self):
+        self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self):
+        """Return hit/miss counters and the hit rate across both tiers"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["bypassed_conversations"] = len(self._bypassed)
+        stats["enabled"] = self.enabled
+        stats["memory_size"] = len(self._memory)
+        stats["disk_size"] = len(self._disk) if self._disk is not None else None
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Buffered conversation logger
+
+Log entries are queued and written by a background thread in group commits
+(every ``flush_entries`` entries or ``flush_interval_ms`` milliseconds),
+through an LRU cache of open per-conversation file handles. Entries written
+after ``close()`` are appended directly, opening and closing their file
+each time, and a forked child starts its own writer.
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+FSYNC_POLICIES = ("never", "batch", "always")
+
+# Queue markers
+_STOP = object()
+
+
+class _FlushRequest:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class ConversationLogWriter:
+    """Background writer for ``conversation_{id}.jsonl`` files"""
+
+    def __init__(
+        self,
+        log_dir,
+        queue_size=10000,
+        flush_entries=100,
+        flush_interval_ms=200,
+        fsync="never",
+        max_open_files=64,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.log_dir = log_dir
+        self.flush_entries = max(1, flush_entries)
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.fsync = fsync
+        self.max_open_files = max(1, max_open_files)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._handles = OrderedDict()
+        self._thread = None
+        self._closed = False
+        self._pid = os.getpid()
+        self._start_lock = threading.Lock()
+        self._direct_lock = threading.Lock()
+        self._stats = {"entries": 0, "batches": 0, "files_opened": 0, "max_queue_depth": 0}
+
+    def _after_fork(self):
+        # The writer thread did not survive fork and the queue may hold the
+        # parent's entries; the child starts over with its own
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._thread = None
+        self._closed = False
+        self._start_lock = threading.Lock()
+        self._direct_lock = threading.Lock()
+        handles, self._handles = self._handles, OrderedDict()
+        for handle in handles.values():
+            try:
+                handle.close()
+            except Exception:
+                pass
+
+    def _ensure_started(self):
+        if self._pid != os.getpid():
+            self._after_fork()
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="conversation-log-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+
+    def write(self, conversation_id, entry):
+        """Queue a log entry; blocks only when the queue is full"""
+        if self._closed and self._pid == os.getpid():
+            # After shutdown append directly, without keeping the file open
+            with self._direct_lock:
+                self._write_batch([(conversation_id, entry)], keep_open=False)
+            return
+        self._ensure_started()
+        self._queue.put((conversation_id, entry))
+        depth = self._queue.qsize()
+        if depth > self._stats["max_queue_depth"]:
+            self._stats["max_queue_depth"] = depth
+
+    def flush(self, timeout=None):
+        """Wait until every entry queued so far has been written"""
+        if self._pid != os.getpid():
+            self._after_fork()
+        if self._thread is None or self._closed:
+            return True
+        request = _FlushRequest()
+        self._queue.put(request)
+        return request.done.wait(timeout)
+
+    def close(self):
+        """Drain the queue, close file handles and stop the writer thread"""
+        if self._pid != os.getpid():
+            self._after_fork()
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+        # Entries queued while stopping are written directly
+        with self._direct_lock:
+            leftover = []
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if isinstance(item, tuple):
+                    leftover.append(item)
+                elif isinstance(item, _FlushRequest):
+                    item.done.set()
+            self._close_handles()
+            if leftover:
+                self._write_batch(leftover, keep_open=False)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["open_files"] = len(self._handles)
+        return stats
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.flush_entries:
+                    continue
+
+            # Group commit: size reached, interval elapsed, flush or stop requested
+            if batch:
+                self._write_batch(batch)
+                batch = []
+            deadline = None
+            if isinstance(item, _FlushRequest):
+                item.done.set()
+            elif item is _STOP:
+                return
+
+    def _get_handle(self, conversation_id):
+        handle = self._handles.get(conversation_id)
+        if handle is not None:
+            self._handles.move_to_end(conversation_id)
+            return handle
+        while len(self._handles) >= self.max_open_files:
+            _, evicted = self._handles.popitem(last=False)
+            evicted.close()
+        handle = self._handles[conversation_id] = open(self._path(conversation_id), "a")
+        self._stats["files_opened"] += 1
+        return handle
+
+    def _path(self, conversation_id):
+        return os.path.join(self.log_dir, f"conversation_{conversation_id}.jsonl")
+
+    def _append(self, handle, entries):
+        if self.fsync == "always":
+            for line in entries:
+                handle.write(line)
+                handle.flush()
+                os.fsync(handle.fileno())
+            return
+        # One append per conversation and batch, so lines written by
+        # several bridge worker processes never interleave
+        handle.write("".join(entries))
+        handle.flush()
+        if self.fsync == "batch":
+            os.fsync(handle.fileno())
+
+    def _write_batch(self, batch, keep_open=True):
+        lines = OrderedDict()
+        for conversation_id, entry in batch:
+            lines.setdefault(conversation_id, []).append(json.dumps(entry) + "\n")
+        for conversation_id, entries in lines.items():
+            try:
+                if keep_open:
+                    self._append(self._get_handle(conversation_id), entries)
+                else:
+                    with open(self._path(conversation_id), "a") as handle:
+                        self._append(handle, entries)
+            except Exception as e:
+                print(f"Error writing log entry for conversation {conversation_id}: {e}")
+        self._stats["entries"] += len(batch)
+        self._stats["batches"] += 1
+
+    def _close_handles(self):
+        while self._handles:
+            _, handle = self._handles.popitem()
+            try:
+                handle.close()
+            except Exception:
+                pass
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Memoization for message improvers
+
+Improvers are plain ``(message_text: str) -> str`` functions. Wrapping one in
+``MemoizedImprover`` caches its output per (normalized) input text with an
+LRU bound and optional TTL, and keeps hit/miss counters per improver.
+"""
+
+import threading
+import time
+
+from ttl_cache import MISSING, TTLCache
+
+# Named key normalizations, applied in the order given
+NORMALIZERS = {
+    "strip": str.strip,
+    "whitespace": lambda text: " ".join(text.split()),
+    "casefold": str.casefold,
+}
+
+
+def build_normalizer(normalize):
+    """Return a key function for ``normalize``.
+
+    ``normalize`` may be None, a callable, a normalizer name
+    (``"strip"``, ``"whitespace"``, ``"casefold"``) or a sequence of names.
+    """
+    if normalize is None:
+        return lambda text: text
+    if callable(normalize):
+        return normalize
+    names = [normalize] if isinstance(normalize, str) else list(normalize)
+    unknown = [name for name in names if name not in NORMALIZERS]
+    if unknown:
+        raise ValueError(f"Unknown normalizer(s) {unknown}; choose from {list(NORMALIZERS)}")
+    steps = [NORMALIZERS[name] for name in names]
+
+    def normalizer(text):
+        for step in steps:
+            text = step(text)
+        return text
+
+    return normalizer
+
+
+class MemoizedImprover:
+    """Callable wrapper that caches an improver's output by input text"""
+
+    def __init__(self, func, name=None, max_entries=256, ttl=None, normalize=None):
+        self.func = func
+        self.name = name or getattr(func, "__name__", "improver")
+        self.__name__ = getattr(func, "__name__", self.name)
+        self.__doc__ = getattr(func, "__doc__", None)
+        self._key = build_normalizer(normalize)
+        # ttl=None keeps entries until they are evicted by the LRU bound
+        self._cache = TTLCache(
+            maxsize=max_entries,
+            ttl=float("inf") if ttl is None else ttl,
+            negative_ttl=0.0,
+        )
+        self._lock = threading.Lock()
+        self._errors = 0
+        self._miss_time = 0.0
+
+    def __call__(self, message_text):
+        key = self._key(message_text)
+        value, _ = self._cache.get(key)
+        if value is not MISSING:
+            return value
+        value = self.uncached(message_text)
+        if value is not None:
+            self._cache.set(key, value)
+        return value
+
+    def uncached(self, message_text):
+        """Run the improver without reading or storing cached output"""
+        start = time.perf_counter()
+        try:
+            value = self.func(message_text)
+        except Exception:
+            with self._lock:
+                self._errors += 1
+            raise
+        with self._lock:
+            self._miss_time += time.perf_counter() - start
+        return value
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        """Return cache counters plus improver errors and average miss latency"""
+        stats = self._cache.stats()
+        with self._lock:
+            stats["errors"] = self._errors
+            stats["avg_miss_ms"] = (
+                round(self._miss_time * 1000 / stats["misses"], 2) if stats["misses"] else 0.0
+            )
+        return stats
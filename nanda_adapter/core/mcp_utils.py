@@ -1,6 +1,7 @@
 from typing import Optional
 import asyncio
-from contextlib import AsyncExitStack
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
 from mcp import ClientSession
 from mcp.client.stdio import stdio_client
 
@@ -12,14 +13,28 @@ from mcp.client.streamable_http import streamablehttp_client
 import json
 import base64
 
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 
 
 import sys
+import weakref
+from urllib.parse import urlsplit
 
 sys.stdout.reconfigure(line_buffering=True)
 
 
+_async_anthropic = None
+
+
+def get_async_anthropic():
+    """Process-wide AsyncAnthropic client, so concurrent queries share its connection pool"""
+    global _async_anthropic
+    if _async_anthropic is None:
+        ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY") or "your-key"
+        _async_anthropic = AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+    return _async_anthropic
+
+
 def parse_jsonrpc_response(response):
     """Helper function to parse JSON-RPC responses from MCP server"""
     if isinstance(response, str):
@@ -37,12 +52,318 @@ def parse_jsonrpc_response(response):
     return str(response)
 
 
+class ToolCatalogCache:
+    """Anthropic tool definitions per MCP server, shared by every query in the process.
+
+    Catalogs expire after ``ttl`` seconds and are dropped immediately when the
+    server sends ``notifications/tools/list_changed``. Each invalidation bumps
+    the server's version so a fetch that raced with it is not stored.
+    """
+
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        self._catalogs = {}
+        self._versions = {}
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def version(self, key):
+        return self._versions.get(key, 0)
+
+    def get(self, key):
+        entry = self._catalogs.get(key)
+        if entry is not None:
+            version, tools, fetched_at = entry
+            if version == self.version(key) and time.monotonic() - fetched_at < self.ttl:
+                self._stats["hits"] += 1
+                return tools
+            del self._catalogs[key]
+        self._stats["misses"] += 1
+        return None
+
+    def put(self, key, tools, version):
+        """Store a catalog fetched when the server was at ``version``"""
+        if version == self.version(key):
+            self._catalogs[key] = (version, tools, time.monotonic())
+
+    def invalidate(self, key):
+        self._versions[key] = self.version(key) + 1
+        self._catalogs.pop(key, None)
+        self._stats["invalidations"] += 1
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["servers"] = len(self._catalogs)
+        return stats
+
+
+tool_catalog_cache = ToolCatalogCache(ttl=float(os.getenv("MCP_TOOL_CACHE_TTL", "300")))
+
+# Fan-out limits for tool_use blocks returned in one response
+MCP_TOOL_CONCURRENCY = int(os.getenv("MCP_TOOL_CONCURRENCY", "4"))
+MCP_TOOL_CALL_TIMEOUT = float(os.getenv("MCP_TOOL_CALL_TIMEOUT", "60"))
+
+
+def tool_definitions(tools):
+    """Convert MCP tools into the tool definitions the Anthropic API expects"""
+    return [
+        {
+            "name": tool.name,
+            "description": tool.description,
+            "input_schema": tool.inputSchema,
+        }
+        for tool in tools
+    ]
+
+
+# Held only by calls in flight, so servers with no running call drop out
+_tool_call_limits = weakref.WeakValueDictionary()
+
+
+def tool_call_limit(mcp_server_url):
+    """Semaphore bounding concurrent tool calls to one MCP server"""
+    # Keyed without the query string, which can carry the server's api_key
+    parts = urlsplit(mcp_server_url)
+    key = f"{parts.scheme}://{parts.netloc}{parts.path}"
+    limit = _tool_call_limits.get(key)
+    if limit is None:
+        limit = _tool_call_limits[key] = asyncio.Semaphore(MCP_TOOL_CONCURRENCY)
+    return limit
+
+
+class PooledMCPSession:
+    """One initialized MCP connection owned by a dedicated task.
+
+    The SSE / streamable-HTTP transports use anyio task groups that must be
+    entered and exited by the same task, so the connection lives in its own
+    task and queries from other tasks only borrow ``session``.
+    """
+
+    def __init__(self, mcp_server_url, transport_type="http", on_tools_changed=None):
+        self.mcp_server_url = mcp_server_url
+        self.transport_type = transport_type
+        self.on_tools_changed = on_tools_changed
+        self.session = None
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error = None
+        self._task = None
+
+    async def start(self, timeout=30.0):
+        """Open the transport and run the initialize() handshake"""
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise ConnectionError(f"Timed out connecting to MCP server {self.mcp_server_url}")
+        if self._error is not None:
+            raise self._error
+
+    async def _run(self):
+        try:
+            async with AsyncExitStack() as stack:
+                if self.transport_type.lower() == "sse":
+                    # SSE client returns only 2 values: read_stream, write_stream
+                    read_stream, write_stream = await stack.enter_async_context(
+                        sse_client(self.mcp_server_url)
+                    )
+                else:
+                    # HTTP client returns 3 values: read_stream, write_stream, session
+                    read_stream, write_stream, _ = await stack.enter_async_context(
+                        streamablehttp_client(self.mcp_server_url)
+                    )
+                session = await stack.enter_async_context(
+                    mcp.ClientSession(
+                        read_stream, write_stream, message_handler=self._handle_message
+                    )
+                )
+                await session.initialize()
+                self.session = session
+                self._ready.set()
+                await self._closing.wait()
+        except Exception as e:
+            self._error = e
+            print(f"MCP connection to {self.mcp_server_url} closed: {e}")
+        finally:
+            self.closed = True
+            self.session = None
+            self._ready.set()
+
+    async def _handle_message(self, message):
+        if isinstance(message, mcp.types.ServerNotification) and isinstance(
+            message.root, mcp.types.ToolListChangedNotification
+        ):
+            print(f"Tool list changed on MCP server {self.mcp_server_url}")
+            if self.on_tools_changed:
+                self.on_tools_changed()
+
+    async def is_alive(self, timeout=5.0):
+        """Ping the server to check the connection is still usable"""
+        if self.closed or self.session is None:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            self.last_checked = time.monotonic()
+            return True
+        except Exception:
+            return False
+
+    async def close(self):
+        self._closing.set()
+        if self._task is not None and not self._task.done():
+            try:
+                await asyncio.wait_for(self._task, 5.0)
+            except Exception:
+                self._task.cancel()
+
+
+class MCPSessionPool:
+    """Initialized MCP sessions keyed by (server URL, transport).
+
+    Repeated queries to the same server reuse a session and skip the
+    transport setup and initialize() handshake. Each server gets at most
+    ``max_sessions_per_server`` connections; sessions idle longer than
+    ``idle_timeout`` are closed, and sessions idle longer than
+    ``liveness_interval`` are pinged before reuse and replaced if dead.
+    """
+
+    def __init__(
+        self,
+        max_sessions_per_server=4,
+        idle_timeout=300.0,
+        liveness_interval=30.0,
+        connect_timeout=30.0,
+    ):
+        self.max_sessions_per_server = max_sessions_per_server
+        self.idle_timeout = idle_timeout
+        self.liveness_interval = liveness_interval
+        self.connect_timeout = connect_timeout
+        self._sessions = {}
+        self._key_locks = {}
+        self._reaper = None
+        self._stats = {"created": 0, "reused": 0, "reconnects": 0, "closed_idle": 0}
+
+    def _lock_for(self, key):
+        lock = self._key_locks.get(key)
+        if lock is None:
+            lock = self._key_locks[key] = asyncio.Lock()
+        return lock
+
+    async def _close_idle(self):
+        now = time.monotonic()
+        for key, sessions in list(self._sessions.items()):
+            for pooled in list(sessions):
+                if pooled.closed or (
+                    pooled.in_use == 0 and now - pooled.last_used > self.idle_timeout
+                ):
+                    sessions.remove(pooled)
+                    if not pooled.closed:
+                        self._stats["closed_idle"] += 1
+                    await pooled.close()
+
+    async def _reap_forever(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 2))
+            await self._close_idle()
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.get_running_loop().create_task(self._reap_forever())
+
+    async def acquire(self, mcp_server_url, transport_type="http"):
+        """Borrow a live session for the server, connecting if necessary"""
+        self._ensure_reaper()
+        key = (mcp_server_url, transport_type.lower())
+        async with self._lock_for(key):
+            await self._close_idle()
+            sessions = self._sessions.setdefault(key, [])
+            while sessions:
+                pooled = min(sessions, key=lambda s: s.in_use)
+                if pooled.in_use and len(sessions) < self.max_sessions_per_server:
+                    break  # Busy; open another connection instead of sharing
+                if (
+                    time.monotonic() - pooled.last_checked > self.liveness_interval
+                    and not await pooled.is_alive()
+                ):
+                    sessions.remove(pooled)
+                    self._stats["reconnects"] += 1
+                    await pooled.close()
+                    continue
+                pooled.in_use += 1
+                pooled.last_used = time.monotonic()
+                self._stats["reused"] += 1
+                return pooled
+
+            pooled = PooledMCPSession(
+                mcp_server_url,
+                transport_type,
+                on_tools_changed=lambda: tool_catalog_cache.invalidate(key),
+            )
+            await pooled.start(self.connect_timeout)
+            sessions.append(pooled)
+            pooled.in_use += 1
+            self._stats["created"] += 1
+            return pooled
+
+    def release(self, pooled):
+        pooled.in_use = max(0, pooled.in_use - 1)
+        pooled.last_used = time.monotonic()
+
+    async def discard(self, pooled):
+        """Drop a session that failed so the next acquire reconnects"""
+        sessions = self._sessions.get(
+            (pooled.mcp_server_url, pooled.transport_type.lower()), []
+        )
+        if pooled in sessions:
+            sessions.remove(pooled)
+            self._stats["reconnects"] += 1
+        await pooled.close()
+
+    @asynccontextmanager
+    async def session(self, mcp_server_url, transport_type="http"):
+        """Context manager yielding a pooled session and releasing it afterwards"""
+        pooled = await self.acquire(mcp_server_url, transport_type)
+        try:
+            yield pooled
+        finally:
+            self.release(pooled)
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for sessions in self._sessions.values():
+            for pooled in sessions:
+                await pooled.close()
+        self._sessions.clear()
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["open_sessions"] = {
+            f"{url} ({transport})": len(sessions)
+            for (url, transport), sessions in self._sessions.items()
+        }
+        return stats
+
+
+# Process-wide pool; sessions belong to the agent bridge's long-lived loop
+mcp_session_pool = MCPSessionPool(
+    max_sessions_per_server=int(os.getenv("MCP_MAX_SESSIONS_PER_SERVER", "4")),
+    idle_timeout=float(os.getenv("MCP_SESSION_IDLE_TIMEOUT", "300")),
+    liveness_interval=float(os.getenv("MCP_SESSION_LIVENESS_INTERVAL", "30")),
+)
+
+
 class MCPClient:
-    def __init__(self):
+    def __init__(self, pool=None):
         self.session = None
+        self.pool = pool or mcp_session_pool
         self.exit_stack = AsyncExitStack()
-        ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY") or "your-key"
-        self.anthropic = Anthropic(api_key=ANTHROPIC_API_KEY)
+        self.anthropic = get_async_anthropic()
 
     async def connect_to_mcp_and_get_tools(self, mcp_server_url, transport_type="http"):
         """Connect to MCP server and return available tools
@@ -51,60 +372,98 @@ class MCPClient:
             mcp_server_url: URL of the MCP server
             transport_type: Either 'http' or 'sse' for transport protocol
         """
+        for attempt in range(2):
+            pooled = await self.connect(mcp_server_url, transport_type)
+            if pooled is None:
+                return None
+
+            try:
+                # Get tools
+                tools_result = await self.session.list_tools()
+                return tools_result.tools
+            except Exception as e:
+                # Stale connection: drop it and reconnect once
+                print(f"MCP session for {mcp_server_url} failed, reconnecting: {e}")
+                await self.pool.discard(pooled)
+                self.session = None
+        return None
+
+    async def connect(self, mcp_server_url, transport_type="http"):
+        """Borrow a pooled, already-initialized session for the server"""
         try:
-            # Create new connection based on transport type
-            if transport_type.lower() == "sse":
-                transport = await self.exit_stack.enter_async_context(
-                    sse_client(mcp_server_url)
-                )
-                # SSE client returns only 2 values: read_stream, write_stream
-                read_stream, write_stream = transport
-            else:
-                transport = await self.exit_stack.enter_async_context(
-                    streamablehttp_client(mcp_server_url)
-                )
-                # HTTP client returns 3 values: read_stream, write_stream, session
-                read_stream, write_stream, _ = transport
-
-            # Create new session
-            self.session = await self.exit_stack.enter_async_context(
-                mcp.ClientSession(read_stream, write_stream)
+            pooled = await self.exit_stack.enter_async_context(
+                self.pool.session(mcp_server_url, transport_type)
             )
-            await self.session.initialize()
-
-            # Get tools
-            tools_result = await self.session.list_tools()
-            return tools_result.tools
+            self.session = pooled.session
+            return pooled
         except Exception as e:
             print(f"Error connecting to MCP server: {e}")
             return None
 
+    async def get_available_tools(self, mcp_server_url, transport_type="http"):
+        """Return the server's tool definitions, using the shared catalog cache"""
+        key = (mcp_server_url, transport_type.lower())
+        available_tools = tool_catalog_cache.get(key)
+        if available_tools is not None:
+            if await self.connect(mcp_server_url, transport_type) is None:
+                return None
+            return available_tools
+
+        version = tool_catalog_cache.version(key)
+        tools = await self.connect_to_mcp_and_get_tools(mcp_server_url, transport_type)
+        if not tools:
+            return None
+        available_tools = tool_definitions(tools)
+        tool_catalog_cache.put(key, available_tools, version)
+        return available_tools
+
+    async def call_tool(self, block, mcp_server_url):
+        """Run one tool_use block and return its tool_result content block"""
+        try:
+            async with tool_call_limit(mcp_server_url):
+                result = await asyncio.wait_for(
+                    self.session.call_tool(block.name, block.input),
+                    MCP_TOOL_CALL_TIMEOUT,
+                )
+            print("Raw tool result: ", result)
+
+            # Parse the result
+            processed_result = parse_jsonrpc_response(result)
+            print("Processed tool result: ", str(processed_result)[:100])
+            return {
+                "type": "tool_result",
+                "tool_use_id": block.id,
+                "content": str(processed_result),
+            }
+        except asyncio.TimeoutError:
+            error = f"Tool {block.name} timed out after {MCP_TOOL_CALL_TIMEOUT}s"
+        except Exception as e:
+            error = f"Tool {block.name} failed: {e}"
+        print(error)
+        return {
+            "type": "tool_result",
+            "tool_use_id": block.id,
+            "content": error,
+            "is_error": True,
+        }
+
     async def process_query(self, query, mcp_server_url, transport_type="http"):
         try:
             print(
                 f"In MCP_utils process query: {query} on {mcp_server_url} using {transport_type}"
             )
-            # Connect and get tools
-            tools = await self.connect_to_mcp_and_get_tools(
+            # Connect and get tools (cached per server)
+            available_tools = await self.get_available_tools(
                 mcp_server_url, transport_type
             )
-            if not tools:
+            if not available_tools:
                 return "Failed to connect to MCP server"
 
-            available_tools = [
-                {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "input_schema": tool.inputSchema,
-                }
-                for tool in tools
-            ]
-
             # Initialize message history
             messages = [{"role": "user", "content": query}]
 
             # Call Claude API
-            message = self.anthropic.messages.create(
+            message = await self.anthropic.messages.create(
                 model="claude-3-5-sonnet-20241022",
                 max_tokens=1024,
                 messages=messages,
@@ -113,63 +472,40 @@ class MCPClient:
 
             # Keep processing until we get a final response without tool calls
             while True:
-                has_tool_calls = False
-
-                # Process each block in the response
-                for block in message.content:
-                    print(block)
-                    print(block.type)
-
-                    if block.type == "tool_use":
-                        has_tool_calls = True
-                        # Extract tool name and arguments
-                        tool_name = block.name
-                        tool_args = block.input
-
-                        # Call the tool
-                        result = await self.session.call_tool(tool_name, tool_args)
-                        print("Raw tool result: ", result)
+                tool_uses = [block for block in message.content if block.type == "tool_use"]
 
-                        # Parse the result
-                        processed_result = parse_jsonrpc_response(result)
-                        print("Processed tool result: ", str(processed_result)[:100])
+                # If no tool calls were made, we have our final response
+                if not tool_uses:
+                    break
 
-                        # Add the assistant's message with tool use
-                        messages.append(
-                            {
-                                "role": "assistant",
-                                "content": [
-                                    {
-                                        "type": "tool_use",
-                                        "id": block.id,
-                                        "name": tool_name,
-                                        "input": tool_args,
-                                    }
-                                ],
-                            }
-                        )
+                # Run independent tool calls concurrently
+                results = await asyncio.gather(
+                    *(self.call_tool(block, mcp_server_url) for block in tool_uses)
+                )
 
-                        # Add the tool result
-                        messages.append(
+                # One assistant turn with every block, one user turn with every result
+                messages.append(
+                    {
+                        "role": "assistant",
+                        "content": [
                             {
-                                "role": "user",
-                                "content": [
-                                    {
-                                        "type": "tool_result",
-                                        "tool_use_id": block.id,
-                                        "content": str(processed_result),
-                                    }
-                                ],
+                                "type": "tool_use",
+                                "id": block.id,
+                                "name": block.name,
+                                "input": block.input,
                             }
-                        )
-
-                # If no tool calls were made, we have our final response
-                if not has_tool_calls:
-                    break
+                            if block.type == "tool_use"
+                            else {"type": "text", "text": block.text}
+                            for block in message.content
+                            if block.type in ("tool_use", "text")
+                        ],
+                    }
+                )
+                messages.append({"role": "user", "content": results})
 
                 print("Getting next response from Claude...")
                 # Get next response from Claude
-                message = self.anthropic.messages.create(
+                message = await self.anthropic.messages.create(
                     model="claude-3-5-sonnet-20241022",
                     max_tokens=1024,
                     messages=messages,
@@ -196,6 +532,7 @@ class MCPClient:
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # Returns borrowed sessions to the pool; connections stay open
         await self.exit_stack.aclose()
         self.session = None
 
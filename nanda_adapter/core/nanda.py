@@ -7,6 +7,7 @@ NANDA - Custom Message Improvement for Agent Bridge
 
 import os
 import sys
+import importlib
 import subprocess
 import time
 import signal
@@ -19,6 +20,7 @@ try:
     from .agent_bridge import *
     from . import run_ui_agent_https
     from .chat_ui_patch import add_chat_ui_route
+    from .wsgi_serving import api_serving_options, serve, serve_agent, serving_options
 except ImportError:
     # If running from parent directory, add current directory to path
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -26,19 +28,34 @@ except ImportError:
     from agent_bridge import *
     import run_ui_agent_https
     from chat_ui_patch import add_chat_ui_route
+    from wsgi_serving import api_serving_options, serve, serve_agent, serving_options
 
 
 class NANDA:
     """NANDA class to create agent_bridge with custom improvement logic"""
 
-    def __init__(self, improvement_logic):
+    def __init__(self, improvement_logic, improver_cache=None, serving=None):
         """
         Initialize NANDA with custom improvement logic
 
         Args:
             improvement_logic: Function that takes (message_text: str) -> str
+            improver_cache: Optional memoization for improvement_logic; True for
+                defaults or a dict of register_message_improver caching options
+                (max_entries, ttl, normalize)
+            serving: Optional server for the bridge and API: "development"
+                (default), "gunicorn", "reuseport", or a dict of wsgi_serving
+                options (server, workers, api_workers, threads, keepalive,
+                timeout, graceful_timeout, max_requests); unset options come
+                from NANDA_* environment variables. ``workers`` applies to the
+                bridge; the API runs ``api_workers`` (default 1) because its
+                mailbox and SSE clients live in process memory
         """
         self.improvement_logic = improvement_logic
+        self.improver_cache = improver_cache
+        if isinstance(serving, str):
+            serving = {"server": serving}
+        self.serving = serving_options(**(serving or {}))
         self.bridge = None
         print(
             f"🤖 NANDA initialized with custom improvement logic: {improvement_logic.__name__}"
@@ -52,7 +69,14 @@ class NANDA:
 
     def register_custom_improver(self):
         """Register the custom improvement logic with agent_bridge"""
-        register_message_improver("nanda_custom", self.improvement_logic)
+        cache_options = {}
+        if self.improver_cache:
+            cache_options = {"cache": True}
+            if isinstance(self.improver_cache, dict):
+                cache_options.update(self.improver_cache)
+        register_message_improver(
+            "nanda_custom", self.improvement_logic, **cache_options
+        )
         print(
             f"🔧 Custom improvement logic '{self.improvement_logic.__name__}' registered"
         )
@@ -120,21 +144,28 @@ class NANDA:
         print(f"Logging conversations to {os.path.abspath(LOG_DIR)}")
         print(f"🔧 Using custom improvement logic: {self.improvement_logic.__name__}")
 
-        # Patch the run_server to add chat UI
+        # Patch the run_server to add chat UI (AgentBridge adds /stream itself)
         print("🔧 Patching Flask app to add /tasks/send chat UI...")
-        from python_a2a.server.http import create_flask_app
-        original_create_flask_app = create_flask_app
+        # python_a2a's "server" attribute can be shadowed by python_a2a.agent_flow,
+        # so patch the module object itself
+        a2a_http = importlib.import_module("python_a2a.server.http")
+        original_create_flask_app = a2a_http.create_flask_app
 
         def patched_create_flask_app(agent):
             app = original_create_flask_app(agent)
             app = add_chat_ui_route(app)
             return app
 
-        import python_a2a.server.http
-        python_a2a.server.http.create_flask_app = patched_create_flask_app
+        a2a_http.create_flask_app = patched_create_flask_app
 
         # Run the agent bridge server
-        run_server(self.bridge, host="0.0.0.0", port=PORT)
+        serve_agent(
+            self.bridge,
+            host="0.0.0.0",
+            port=PORT,
+            options=self.serving,
+            shared_state=use_shared_state(self.serving["workers"]),
+        )
 
     def start_server_api(
         self,
@@ -209,6 +240,7 @@ class NANDA:
 
         signal.signal(signal.SIGINT, cleanup)
         signal.signal(signal.SIGTERM, cleanup)
+        run_ui_agent_https.registry_config.install_sighup_reload()
 
         # Get server IP
         server_ip = get_server_ip()
@@ -229,7 +261,7 @@ class NANDA:
         # Set global variables in run_ui_agent_https module
         run_ui_agent_https.agent_id = agent_id
         run_ui_agent_https.agent_port = port
-        run_ui_agent_https.registry_url = registry
+        run_ui_agent_https.registry_config.set_override(registry)
 
         # Set default URLs if not provided
         if not public_url:
@@ -264,9 +296,20 @@ class NANDA:
             print(f"🚀 Starting agent bridge for {agent_id} on port {port}...")
             self.start_server()
 
-        # Start the bridge server in a non-daemon thread
-        bridge_thread = threading.Thread(target=start_bridge_server, daemon=False)
-        bridge_thread.start()
+        # gunicorn and reuseport masters need a main thread: with them the bridge
+        # runs in a child process and the API server in this thread
+        production = self.serving["server"] != "development"
+        if production:
+            bridge_pid = os.fork()
+            if bridge_pid == 0:
+                try:
+                    start_bridge_server()
+                finally:
+                    os._exit(0)
+        else:
+            # Start the bridge server in a non-daemon thread
+            bridge_thread = threading.Thread(target=start_bridge_server, daemon=False)
+            bridge_thread.start()
 
         # Give the bridge a moment to start
         time.sleep(2)
@@ -281,9 +324,11 @@ class NANDA:
         print("\n📡 API Endpoints:")
         print(f"  GET  {api_url}/api/health - Health check")
         print(f"  POST {api_url}/api/send - Send a message to the client")
+        print(f"  POST {api_url}/api/send/stream - Send a message and stream the response (SSE)")
         print(f"  GET  {api_url}/api/agents/list - List all registered agents")
         print(f"  POST {api_url}/api/receive_message - Receive a message from agent")
-        print(f"  GET  {api_url}/api/render - Get the latest message")
+        print(f"  GET  {api_url}/api/render - Get the next message (?since=<seq>&wait=<s> to long-poll)")
+        print(f"  GET  {api_url}/api/messages/stream?client_id=<id> - Stream messages (SSE)")
         print("\n🛑 Press Ctrl+C to stop all processes.")
 
         # Configure SSL context if needed
@@ -311,19 +356,34 @@ class NANDA:
                 sys.exit(1)
 
         # Start the Flask API server in a separate thread
-        def start_flask_server():
+        def start_flask_server(on_exit=None):
             """Start the Flask API server in a separate thread"""
             try:
                 print(f"🚀 Starting Flask API server on port {api_port}...")
-                run_ui_agent_https.app.run(
-                    host="0.0.0.0",
-                    port=api_port,
-                    threaded=True,
+                api_options = api_serving_options(self.serving)
+                run_ui_agent_https.set_stream_limit(api_options["max_streams"])
+                serve(
+                    run_ui_agent_https.app,
+                    "0.0.0.0",
+                    api_port,
                     ssl_context=ssl_context,
+                    options=api_options,
+                    on_reload=run_ui_agent_https.registry_config.reload,
+                    on_exit=on_exit,
+                    name="nanda-api",
                 )
             except Exception as e:
                 print(f"❌ Error starting Flask server: {e}")
 
+        if production:
+            print("******************************************************")
+            print("You can assign your agent using this link")
+            print(f"https://chat.nanda-registry.com/landing.html?agentId={agent_id}")
+            print("******************************************************")
+            # Blocks until gunicorn shuts down, then stops the bridge
+            start_flask_server(on_exit=lambda: os.kill(bridge_pid, signal.SIGTERM))
+            return
+
         # Start the Flask server in a non-daemon thread
         flask_thread = threading.Thread(target=start_flask_server, daemon=False)
         flask_thread.start()
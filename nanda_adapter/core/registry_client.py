@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP client for NANDA registry calls
+
+Owns one pooled ``requests.Session`` with consistent connect/read timeouts,
+bounded retries with jittered exponential backoff and per-endpoint latency
+histograms.
+"""
+
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms, error=False):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if elapsed_ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if error:
+            self.errors += 1
+
+    def snapshot(self):
+        labels = [f"le_{bound}ms" for bound in self.buckets] + ["inf"]
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class RegistryClient:
+    """Pooled, retrying HTTP client for registry endpoints"""
+
+    def __init__(
+        self,
+        connect_timeout=3.05,
+        read_timeout=10.0,
+        retries=2,
+        backoff=0.25,
+        backoff_max=2.0,
+        pool_maxsize=20,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter keeps many workers from retrying in lockstep
+        delay = min(self.backoff_max, self.backoff * (2**attempt))
+        time.sleep(random.uniform(0, delay))
+
+    def _observe(self, endpoint, elapsed_ms, error):
+        with self._lock:
+            histogram = self._histograms.get(endpoint)
+            if histogram is None:
+                histogram = self._histograms[endpoint] = LatencyHistogram()
+            histogram.observe(elapsed_ms, error)
+
+    def request(self, method, url, endpoint, **kwargs):
+        """Send a request, retrying connection failures and gateway errors.
+
+        ``endpoint`` is a short label (e.g. ``"lookup"``) used for the latency
+        histograms so per-agent URLs do not create one series each. POSTs are
+        only retried when the connection could not be established.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        idempotent = method.upper() in ("GET", "HEAD")
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._observe(endpoint, (time.perf_counter() - start) * 1000, True)
+                connect_failed = not isinstance(e, requests.ReadTimeout)
+                if attempt >= self.retries or not (idempotent or connect_failed):
+                    raise
+            else:
+                error = response.status_code >= 500
+                self._observe(endpoint, (time.perf_counter() - start) * 1000, error)
+                if not (
+                    idempotent
+                    and response.status_code in RETRY_STATUSES
+                    and attempt < self.retries
+                ):
+                    return response
+            self._sleep_before_retry(attempt)
+            attempt += 1
+
+    def get(self, url, endpoint, **kwargs):
+        return self.request("GET", url, endpoint, **kwargs)
+
+    def post(self, url, endpoint, **kwargs):
+        return self.request("POST", url, endpoint, **kwargs)
+
+    def latency_stats(self):
+        """Return a snapshot of the per-endpoint latency histograms"""
+        with self._lock:
+            return {name: h.snapshot() for name, h in self._histograms.items()}
+
+
+registry_client = RegistryClient(
+    connect_timeout=float(os.getenv("REGISTRY_CONNECT_TIMEOUT", "3.05")),
+    read_timeout=float(os.getenv("REGISTRY_READ_TIMEOUT", "10")),
+    retries=int(os.getenv("REGISTRY_RETRIES", "2")),
+)
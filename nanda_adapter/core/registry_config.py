@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Registry endpoint configuration shared by agent_bridge and run_ui_agent_https
+
+The registry URL is resolved once (explicit override or REGISTRY_URL, then
+registry_url.txt, then the default) and memoized. Hot reload is optional: either poll the
+file's mtime every REGISTRY_URL_RELOAD_INTERVAL seconds or reload on SIGHUP.
+"""
+
+import os
+import signal
+import threading
+import time
+
+DEFAULT_REGISTRY_URL = "https://chat.nanda-registry.com:6900"
+
+
+class RegistryConfig:
+    """Memoized registry URL with optional mtime-based hot reload"""
+
+    def __init__(
+        self,
+        path="registry_url.txt",
+        default_url=DEFAULT_REGISTRY_URL,
+        reload_interval=0.0,
+        override=None,
+    ):
+        self.path = path
+        self.default_url = default_url
+        self.reload_interval = reload_interval
+        self._override = override or None
+        self._url = None
+        self._reload_requested = False
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def set_override(self, url):
+        """Use an explicit registry URL (e.g. --registry) instead of the file"""
+        with self._lock:
+            self._override = url or None
+            self._reload_requested = True
+
+    def reload(self):
+        """Re-resolve the registry URL on the next call"""
+        # No lock: this runs from the SIGHUP handler
+        self._reload_requested = True
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def _resolve(self):
+        if self._override:
+            return self._override, "override"
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    url = f.read().strip()
+                if url:
+                    return url, "file"
+        except Exception as e:
+            print(f"Error reading registry URL from file: {e}")
+        return self.default_url, "default"
+
+    def get_url(self):
+        """Return the registry URL, touching the filesystem only when reloading"""
+        with self._lock:
+            stale = self._url is None or self._reload_requested
+            if not stale and self.reload_interval > 0 and not self._override:
+                now = time.monotonic()
+                if now - self._checked_at >= self.reload_interval:
+                    self._checked_at = now
+                    stale = self._file_mtime() != self._mtime
+
+            if stale:
+                self._reload_requested = False
+                url, source = self._resolve()
+                if url != self._url:
+                    print(f"Using registry URL ({source}): {url}")
+                self._url = url
+                self._mtime = self._file_mtime()
+                self._checked_at = time.monotonic()
+            return self._url
+
+    def install_sighup_reload(self):
+        """Reload the registry URL on SIGHUP; must be called from the main thread"""
+        if not hasattr(signal, "SIGHUP"):
+            return False
+        signal.signal(signal.SIGHUP, lambda signum, frame: self.reload())
+        return True
+
+
+registry_config = RegistryConfig(
+    reload_interval=float(os.getenv("REGISTRY_URL_RELOAD_INTERVAL", "0")),
+    override=os.getenv("REGISTRY_URL"),
+)
+
+
+def get_registry_url():
+    """Get the registry URL from the shared configuration"""
+    return registry_config.get_url()
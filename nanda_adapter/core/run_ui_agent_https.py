@@ -2,17 +2,30 @@
 import os
 import subprocess
 import time
-import requests
 import sys
 import signal
 import argparse
 import threading
 import json
+import hashlib
+import uuid
 from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from python_a2a import A2AClient, Message, TextContent, MessageRole, Metadata
-from queue import Queue
-from threading import Event
+from python_a2a import Message, TextContent, MessageRole, Metadata
+from a2a_pool import a2a_pool
+from registry_client import registry_client
+from registry_config import registry_config, get_registry_url
+from ui_mailbox import MessageMailbox
+from ui_push import PushHub
+from sender_names import SenderNameCache
+from agent_directory import AgentDirectory, GZIP_MIN_BYTES, gzip_body
+from wsgi_serving import (
+    add_serving_arguments,
+    api_serving_options,
+    export_serving_options,
+    serve,
+    serving_options_from_args,
+)
 import ssl
 import datetime
 
@@ -20,7 +33,6 @@ sys.stdout.reconfigure(line_buffering=True)
 
 # Global variables
 bridge_process = None
-registry_url = None
 agent_id = None
 agent_port = None
 app = Flask(__name__)
@@ -37,9 +49,50 @@ def add_cors_headers(response):
     return response
 
 
-# Message queues for SSE (Server-Sent Events)
-# This allows us to push messages to the UI when they arrive
-client_queues = {}
+# Messages received from the agent bridge, read by /api/render
+ui_mailbox = MessageMailbox(
+    capacity=int(os.getenv("UI_MAILBOX_CAPACITY", "1000")),
+    spill_path=os.getenv("UI_MAILBOX_SPILL_FILE") or None,
+    spill_max_bytes=int(os.getenv("UI_MAILBOX_SPILL_MAX_BYTES", str(64 * 1024 * 1024))),
+)
+
+# Longest a long-polling /api/render request may block, in seconds
+RENDER_MAX_WAIT = float(os.getenv("RENDER_MAX_WAIT", "30"))
+
+# Long-lived responses each hold a server thread; see set_stream_limit
+stream_slots = None
+
+
+def set_stream_limit(limit):
+    """Allow at most ``limit`` concurrent streams and long-polls (None: no limit)"""
+    global stream_slots
+    stream_slots = threading.BoundedSemaphore(limit) if limit else None
+    if limit:
+        print(f"Serving at most {limit} concurrent UI streams per API worker")
+
+
+def acquire_stream_slot():
+    """Reserve a thread for a long-lived response; returns a release callback or None"""
+    slots = stream_slots
+    if slots is None:
+        return lambda: None
+    if not slots.acquire(blocking=False):
+        return None
+    return slots.release
+
+
+def streams_busy():
+    response = jsonify({"error": "Too many open streams, retry later"})
+    response.headers["Retry-After"] = "5"
+    return response, 503
+
+# SSE (Server-Sent Events) push to registered UI clients, resuming from the mailbox
+push_hub = PushHub(
+    ui_mailbox,
+    queue_size=int(os.getenv("SSE_CLIENT_QUEUE_SIZE", "1000")),
+    heartbeat=float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15")),
+    client_ttl=float(os.getenv("SSE_CLIENT_TTL", "300")),
+)
 
 
 def cleanup(signum=None, frame=None):
@@ -53,27 +106,51 @@ def cleanup(signum=None, frame=None):
     sys.exit(0)
 
 
-def get_registry_url():
-    """Get the registry URL from file or use default"""
-    global registry_url
-
-    if registry_url:
-        return registry_url
+def fetch_sender_name(from_agent):
+    """Fetch an agent's sender name from the registry; raises if it is unavailable"""
+    reg_url = get_registry_url()
+    response = registry_client.get(
+        f"{reg_url}/sender/{from_agent}",
+        "sender",
+        verify=False,  # For development with self-signed certs
+    )
+    if response.status_code == 200:
+        return response.json().get("sender_name")
+    if response.status_code >= 500:
+        raise RuntimeError(f"registry returned {response.status_code}")
+    return None
 
-    try:
-        if os.path.exists("registry_url.txt"):
-            with open("registry_url.txt", "r") as f:
-                url = f.read().strip()
-                print(f"Using registry URL from file: {url}")
-                return url
-    except Exception as e:
-        print(f"Error reading registry URL: {e}")
 
-    # Default if file doesn't exist
-    print(
-        "Registry URL file not found. Using default: https://chat.nanda-registry.com:6900"
+def sender_name_resolved(from_agent, sender_name):
+    """Replace the agent id shown on messages received before the name was known"""
+    seqs = ui_mailbox.update(
+        {"from_agent": from_agent, "sender_name": from_agent}, {"sender_name": sender_name}
     )
-    return "https://chat.nanda-registry.com:6900"
+    if seqs:
+        push_hub.notify(
+            "sender_name",
+            {"from_agent": from_agent, "sender_name": sender_name, "seqs": seqs},
+        )
+
+
+sender_names = SenderNameCache(
+    fetch_sender_name,
+    maxsize=int(os.getenv("SENDER_NAME_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("SENDER_NAME_TTL", "3600")),
+    negative_ttl=float(os.getenv("SENDER_NAME_NEGATIVE_TTL", "300")),
+    on_resolved=sender_name_resolved,
+)
+
+# Registry agent listing, refreshed in the background for /api/agents/list
+agent_directory = AgentDirectory(
+    registry_client,
+    get_registry_url,
+    refresh_interval=float(os.getenv("AGENT_DIRECTORY_REFRESH", "30")),
+    request_kwargs={"verify": False},  # For development with self-signed certs
+    # Warm the sender-name cache whenever the listing changes
+    on_change=lambda listing, changed_ids: sender_names.prefetch(listing),
+)
+AGENT_LIST_MAX_LIMIT = int(os.getenv("AGENT_LIST_MAX_LIMIT", "500"))
 
 
 def register_agent(agent_id, public_url):
@@ -81,8 +158,9 @@ def register_agent(agent_id, public_url):
     reg_url = get_registry_url()
     try:
         print(f"Registering agent {agent_id} at {public_url}")
-        response = requests.post(
+        response = registry_client.post(
             f"{reg_url}/register",
+            "register",
             json={"agent_id": agent_id, "agent_url": public_url},
             verify=False,  # For development with self-signed certs
         )
@@ -102,8 +180,9 @@ def lookup_agent(agent_id):
     reg_url = get_registry_url()
     try:
         print(f"Looking up agent {agent_id} in registry...")
-        response = requests.get(
+        response = registry_client.get(
             f"{reg_url}/lookup/{agent_id}",
+            "lookup",
             verify=False,  # For development with self-signed certs
         )
         if response.status_code == 200:
@@ -117,18 +196,22 @@ def lookup_agent(agent_id):
         return None
 
 
-def add_message_to_queue(client_id, message):
-    """Add a message to a client's queue for SSE streaming"""
-    if client_id in client_queues:
-        client_queues[client_id]["queue"].put(message)
-        client_queues[client_id]["event"].set()
-
-
 # Message handling endpoints
 @app.route("/api/health", methods=["GET"])
 def health_check():
-    """Simple health check endpoint"""
-    return jsonify({"status": "ok", "agent_id": agent_id})
+    """Health check with this API process's cache, pool and queue counters
+
+    Counters of the agent bridge are served by the bridge's own /stats route.
+    """
+    stats = {
+        "mailbox": ui_mailbox.stats(),
+        "push": push_hub.stats(),
+        "sender_names": sender_names.stats(),
+        "agent_directory": agent_directory.stats(),
+        "a2a_pool": a2a_pool.stats(),
+        "registry_latency": registry_client.latency_stats(),
+    }
+    return jsonify({"status": "ok", "agent_id": agent_id, "stats": stats})
 
 
 @app.route("/api/send", methods=["POST", "OPTIONS"])
@@ -169,17 +252,18 @@ def send_message():
         bridge_url = (
             f"http://localhost:{agent_port}/a2a"  # Remove /a2a since A2AClient adds it
         )
-        client = A2AClient(bridge_url, timeout=60)
 
         # Send the message to the bridge WITHOUT preprocessing
         # Let the bridge handle "@" commands and "/query" commands
-        response = client.send_message(
+        response = a2a_pool.send_message(
+            bridge_url,
             Message(
                 role=MessageRole.USER,
                 content=TextContent(text=message_text),
                 conversation_id=conversation_id,
                 metadata=Metadata(custom_fields=metadata),
-            )
+            ),
+            timeout=60,
         )
         print(f"Response: {response}")
         # Extract the response from the agent
@@ -200,33 +284,129 @@ def send_message():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route("/api/agents/list", methods=["GET"])
-def list_agents():
-    """List all registered clients"""
-    reg_url = get_registry_url()
+@app.route("/api/send/stream", methods=["POST"])
+def send_message_stream():
+    """Send a message to the agent bridge and relay its response as SSE chunks"""
+    release = None
     try:
-        # Use clients endpoint if available
-        try:
-            response = requests.get(
-                f"{reg_url}/clients",
-                verify=False,  # For development with self-signed certs
-            )
-        except:
-            # Fall back to list endpoint
-            response = requests.get(
-                f"{reg_url}/list",
-                verify=False,  # For development with self-signed certs
-            )
+        data = request.json
+        if not data or "message" not in data:
+            return jsonify({"error": "Missing message in request"}), 400
+        release = acquire_stream_slot()
+        if release is None:
+            return streams_busy()
 
-        if response.status_code == 200:
-            return jsonify(response.json())
-        return (
-            jsonify({"error": f"Failed to get agent list: {response.text}"}),
-            response.status_code,
+        conversation_id = data.get("conversation_id") or str(uuid.uuid4())
+        client_id = data.get("client_id", "ui_client")
+        metadata = {"source": "ui_client", "client_id": client_id}
+        message = Message(
+            role=MessageRole.USER,
+            content=TextContent(text=data["message"]),
+            conversation_id=conversation_id,
+            metadata=Metadata(custom_fields=metadata),
         )
+
+        # The bridge streams through python_a2a's /stream route
+        stream_url = f"http://localhost:{agent_port}/stream"
+        upstream = a2a_pool.get_session(stream_url).post(
+            stream_url,
+            json=message.to_dict(),
+            headers={"Accept": "text/event-stream"},
+            stream=True,
+            timeout=(3.05, 60),
+        )
+        if upstream.status_code != 200:
+            upstream.close()
+            release()
+            return (
+                jsonify({"error": f"Bridge returned HTTP {upstream.status_code}"}),
+                502,
+            )
     except Exception as e:
+        print(f"Error in /api/send/stream: {str(e)}")
+        if release is not None:
+            release()
         return jsonify({"error": str(e)}), 500
 
+    def relay():
+        try:
+            for chunk in upstream.iter_content(chunk_size=None):
+                yield chunk
+        finally:
+            upstream.close()
+
+    response = Response(
+        stream_with_context(relay()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "X-Conversation-Id": conversation_id,
+            "Access-Control-Expose-Headers": "X-Conversation-Id",
+        },
+    )
+    response.call_on_close(release)
+    return response
+
+
+def cached_json_response(body, etag, compressed=None):
+    """Return a JSON body with its ETag, answering If-None-Match with 304
+
+    The body is gzipped when the client accepts it and it is large enough to
+    be worth it; ``compressed`` is a pre-built gzip of ``body``.
+    """
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    accept = request.headers.get("Accept-Encoding", "")
+    if "gzip" in accept and len(body) >= GZIP_MIN_BYTES:
+        body = compressed if compressed is not None else gzip_body(body)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype="application/json", headers=headers)
+
+
+@app.route("/api/agents/list", methods=["GET"])
+def list_agents():
+    """List registered agents from the locally cached agent directory
+
+    Without query parameters the registry listing is returned unchanged.
+    With ``prefix`` (agent id prefix, case-insensitive), ``offset`` or
+    ``limit`` a page is returned as
+    {"agents": [...], "total": n, "offset": n, "limit": n, "next_offset": n|null}.
+    Responses carry an ETag and honour If-None-Match.
+    """
+    try:
+        snapshot = agent_directory.snapshot()
+    except Exception as e:
+        return jsonify({"error": f"Failed to get agent list: {e}"}), 502
+
+    if not any(name in request.args for name in ("prefix", "offset", "limit")):
+        return cached_json_response(snapshot.body, snapshot.etag, snapshot.gzip_body)
+
+    prefix = request.args.get("prefix", "")
+    offset = max(0, request.args.get("offset", 0, type=int))
+    limit = max(1, min(request.args.get("limit", 50, type=int), AGENT_LIST_MAX_LIMIT))
+    # The page is derived from the snapshot, so its ETag can be checked first
+    query = hashlib.sha1(f"{prefix}\0{offset}\0{limit}".encode("utf-8")).hexdigest()[:12]
+    etag = f"{snapshot.etag}-{query}"
+    if request.if_none_match.contains(etag):
+        return cached_json_response(b"", etag)
+
+    agents, total = snapshot.search(prefix, offset, limit)
+    next_offset = offset + len(agents)
+    page = {
+        "agents": agents,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset if next_offset < total else None,
+    }
+    return cached_json_response(json.dumps(page).encode("utf-8"), etag)
+
 
 @app.route("/api/receive_message", methods=["POST"])
 def receive_message():
@@ -238,12 +418,9 @@ def receive_message():
         conversation_id = data.get("conversation_id", "")
         timestamp = data.get("timestamp", "")
 
-        reg_url = get_registry_url()
-        sender_name = requests.get(
-            f"{reg_url}/sender/{from_agent}",
-            verify=False,  # For development with self-signed certs
-        )
-        sender_name = sender_name.json().get("sender_name")
+        # Never wait on the registry here: unknown names are fetched in the
+        # background and the agent id is shown until then
+        sender_name = sender_names.get(from_agent) or from_agent
 
         print("\n--- New message received ---")
         print(f"From: {from_agent}")
@@ -253,23 +430,18 @@ def receive_message():
         print(f"Sender Name: {sender_name}")
         print("----------------------------\n")
 
-        # Create a unique file for each agent to avoid conflicts when running multiple agents
-        message_file = f"latest_message.json"
-
-        # Create a JavaScript snippet that the client can use to display this
-        with open(message_file, "w") as f:
-            json.dump(
-                {
-                    "message": message,
-                    "from_agent": from_agent,
-                    "sender_name": sender_name,
-                    "conversation_id": conversation_id,
-                    "timestamp": timestamp,
-                },
-                f,
-            )
+        ui_message = {
+            "message": message,
+            "from_agent": from_agent,
+            "sender_name": sender_name,
+            "conversation_id": conversation_id,
+            "timestamp": timestamp,
+        }
+        seq = ui_mailbox.post(ui_message)
+        # Push to connected SSE clients
+        push_hub.publish(dict(ui_message, seq=seq))
 
-        return jsonify({"status": "received"})
+        return jsonify({"status": "received", "seq": seq})
     except Exception as e:
         print(f"Error processing received message: {e}")
         return jsonify({"error": str(e)}), 500
@@ -277,49 +449,81 @@ def receive_message():
 
 @app.route("/api/render", methods=["GET"])
 def render_on_ui():
+    """Return messages received from the agent bridge
+
+    With ``since`` every message after that sequence number is returned as
+    {"messages": [...], "latest_seq": n, "missed": n}. Without it the client's
+    next unread message (or {}) is returned in the original format. ``wait``
+    long-polls: the request blocks up to that many seconds (capped by
+    RENDER_MAX_WAIT) until a message arrives. When every stream slot is
+    taken it answers right away instead.
+    """
+    release = lambda: None
     try:
-        # Use agent-specific message file
-        message_file = f"latest_message.json"
-
-        if not os.path.exists(message_file):
-            return jsonify({})
-        else:
-            latest_message = json.load(open(message_file))
-            # Remove the original file
-            os.remove(message_file)
-            return jsonify(latest_message)
+        client_id = request.args.get("client_id", "ui_client")
+        since = request.args.get("since", type=int)
+        wait = max(0.0, min(request.args.get("wait", 0.0, type=float), RENDER_MAX_WAIT))
+        if wait:
+            release = acquire_stream_slot()
+            if release is None:
+                release, wait = (lambda: None), 0.0
+        if since is None:
+            messages, _ = ui_mailbox.read_for(client_id, limit=1, wait=wait)
+            return jsonify(messages[0] if messages else {})
+
+        limit = max(1, min(request.args.get("limit", 100, type=int), 1000))
+        messages, missed = ui_mailbox.read_for(client_id, since, limit, wait=wait)
+        return jsonify(
+            {"messages": messages, "latest_seq": ui_mailbox.latest_seq, "missed": missed}
+        )
     except Exception as e:
-        print(f"No latest message found")
+        print(f"Error reading UI messages: {e}")
         return jsonify({"error": str(e)}), 500
+    finally:
+        release()
 
 
-@app.route("/api/messages/stream", methods=["GET"])
-def stream_messages():
-    """SSE endpoint for streaming messages to UI clients"""
-    client_id = request.args.get("client_id")
-    if not client_id or client_id not in client_queues:
-        return jsonify({"error": "Client not registered"}), 400
+@app.route("/api/messages/register", methods=["POST"])
+def register_stream_client():
+    """Register an SSE client so messages are queued for it before it connects"""
+    data = request.get_json(silent=True) or {}
+    client_id = data.get("client_id") or str(uuid.uuid4())
+    push_hub.register(client_id)
+    return jsonify({"client_id": client_id, "latest_seq": ui_mailbox.latest_seq})
 
-    def generate():
-        client_data = client_queues[client_id]
-        queue = client_data["queue"]
-        event = client_data["event"]
 
-        # Send any queued messages
-        while True:
-            # Wait for new messages
-            event.wait()
+@app.route("/api/messages/unregister", methods=["POST"])
+def unregister_stream_client():
+    data = request.get_json(silent=True) or {}
+    client_id = data.get("client_id", "")
+    if not push_hub.unregister(client_id):
+        return jsonify({"error": "Client not registered"}), 404
+    return jsonify({"status": "unregistered", "client_id": client_id})
 
-            # Get all queued messages
-            while not queue.empty():
-                message = queue.get()
-                yield f"data: {json.dumps(message)}\n\n"
 
-            # Reset event
-            event.clear()
+@app.route("/api/messages/stream", methods=["GET"])
+def stream_messages():
+    """SSE endpoint for streaming messages to UI clients
+
+    Event ids are mailbox sequence numbers; reconnecting with Last-Event-ID
+    (or ?last_event_id=) replays everything after it that is still buffered.
+    """
+    client_id = request.args.get("client_id")
+    if not client_id:
+        return jsonify({"error": "Missing client_id"}), 400
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get(
+        "last_event_id"
+    )
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID must be a sequence number"}), 400
+    release = acquire_stream_slot()
+    if release is None:
+        return streams_busy()
 
     response = Response(
-        stream_with_context(generate()),
+        push_hub.stream(client_id, last_event_id),
         mimetype="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -328,18 +532,20 @@ def stream_messages():
             "Connection": "keep-alive",
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Methods": "GET, OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type",
+            "Access-Control-Allow-Headers": "Content-Type, Last-Event-ID",
         },
     )
+    response.call_on_close(release)
     return response
 
 
 def main():
-    global bridge_process, registry_url, agent_id, agent_port
+    global bridge_process, agent_id, agent_port
 
     # Set up signal handlers
     signal.signal(signal.SIGINT, cleanup)
     signal.signal(signal.SIGTERM, cleanup)
+    registry_config.install_sighup_reload()
 
     parser = argparse.ArgumentParser(description="Run an agent with Flask API wrapper")
     parser.add_argument("--id", required=True, help="Agent ID")
@@ -357,14 +563,16 @@ def main():
     parser.add_argument(
         "--ssl", action="store_true", help="Enable SSL with default certificates"
     )
+    add_serving_arguments(parser)
 
     args = parser.parse_args()
+    serving = serving_options_from_args(args)
 
     # Set global variables
     agent_id = args.id
     agent_port = args.port
     api_port = args.api_port
-    registry_url = args.registry
+    registry_config.set_override(args.registry)
 
     # Determine public URL for registration
     public_url = args.public_url
@@ -392,6 +600,9 @@ def main():
 
     log_file = open(f"{log_dir}/bridge_run.txt", "a")
 
+    # The bridge subprocess reads its serving options from the environment
+    export_serving_options(serving)
+
     # . the agent bridge
     print(f"Starting agent bridge for {agent_id} on port {agent_port}...")
     bridge_process = subprocess.Popen(
@@ -414,9 +625,11 @@ def main():
     print("\nAPI Endpoints:")
     print(f"  GET  {api_url}/api/health - Health check")
     print(f"  POST {api_url}/api/send - Send a message to the client")
+    print(f"  POST {api_url}/api/send/stream - Send a message and stream the response (SSE)")
     print(f"  GET  {api_url}/api/agents/list - List all registered agents")
     print(f"  POST {api_url}/api/receive_message - Receive a message from agent")
-    print(f"  GET  {api_url}/api/render - Get the latest message")
+    print(f"  GET  {api_url}/api/render - Get the next message (?since=<seq>&wait=<s> to long-poll)")
+    print(f"  GET  {api_url}/api/messages/stream?client_id=<id> - Stream messages (SSE)")
     print("\nPress Ctrl+C to stop all processes.")
 
     # Configure SSL context if needed
@@ -438,7 +651,18 @@ def main():
             sys.exit(1)
 
     # Start the Flask API server
-    app.run(host="0.0.0.0", port=api_port, threaded=True, ssl_context=ssl_context)
+    api_options = api_serving_options(serving)
+    set_stream_limit(api_options["max_streams"])
+    serve(
+        app,
+        "0.0.0.0",
+        api_port,
+        ssl_context=ssl_context,
+        options=api_options,
+        on_reload=registry_config.reload,
+        on_exit=lambda: bridge_process and bridge_process.terminate(),
+        name="nanda-api",
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Non-blocking cache of agent sender names
+
+``receive_message`` used to ask the registry for the sender's display name
+before replying to every message. SenderNameCache answers from memory; a
+miss or an expired entry is fetched in the background so the caller can use
+the agent id now and later messages get the name; ``on_resolved`` is then
+called so messages already shown with the id can be updated. Names can also
+be prefetched in bulk, e.g. from an agent listing.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ttl_cache import MISSING, TTLCache
+
+
+def names_from_listing(listing):
+    """Yield ``(agent_id, name_or_None)`` pairs from a registry agent listing.
+
+    Accepts a list of agent ids or agent dicts, or a dict keyed by agent id.
+    """
+    if isinstance(listing, dict):
+        listing = listing.get("agents", listing)
+    if isinstance(listing, dict):
+        items = (
+            dict(value, agent_id=key) if isinstance(value, dict) else {"agent_id": key}
+            for key, value in listing.items()
+        )
+    elif isinstance(listing, list):
+        items = (
+            entry if isinstance(entry, dict) else {"agent_id": entry} for entry in listing
+        )
+    else:
+        return
+    for entry in items:
+        agent_id = entry.get("agent_id") or entry.get("id")
+        if isinstance(agent_id, str) and agent_id:
+            yield agent_id, entry.get("sender_name") or entry.get("name")
+
+
+class SenderNameCache:
+    """TTL/LRU cache of agent_id -> sender name with background fetching"""
+
+    def __init__(
+        self, fetch, maxsize=4096, ttl=3600.0, negative_ttl=300.0, workers=4, on_resolved=None
+    ):
+        # ``fetch(agent_id)`` returns the name, None if unknown, or raises
+        self.fetch = fetch
+        # ``on_resolved(agent_id, name)`` runs when a name is found for an
+        # agent that ``get`` had to answer without one
+        self.on_resolved = on_resolved
+        # Expired names are still served while they are refreshed
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, negative_ttl=negative_ttl, stale_ttl=ttl)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sender-name")
+        self._pending = set()
+        self._unresolved = set()
+        self._lock = threading.Lock()
+        self._stats = {"fetches": 0, "fetch_errors": 0, "primed": 0}
+
+    def get(self, agent_id):
+        """Return the cached name (None if unknown or not fetched yet); never blocks"""
+        value, stale = self._cache.get(agent_id)
+        if value is MISSING or stale:
+            if value is MISSING or value is None:
+                with self._lock:
+                    self._unresolved.add(agent_id)
+            self._schedule(agent_id)
+        return None if value is MISSING else value
+
+    def _schedule(self, agent_id):
+        with self._lock:
+            if agent_id in self._pending:
+                return
+            self._pending.add(agent_id)
+        self._executor.submit(self._load, agent_id)
+
+    def _load(self, agent_id):
+        try:
+            name = self.fetch(agent_id)
+            self._cache.set(agent_id, name)
+            with self._lock:
+                self._stats["fetches"] += 1
+                unresolved = agent_id in self._unresolved
+                self._unresolved.discard(agent_id)
+            if name and unresolved and self.on_resolved is not None:
+                self.on_resolved(agent_id, name)
+        except Exception as e:
+            with self._lock:
+                self._stats["fetch_errors"] += 1
+            print(f"Error fetching sender name for {agent_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(agent_id)
+                self._unresolved.discard(agent_id)
+
+    def prime(self, agent_id, name):
+        """Store a name obtained elsewhere"""
+        self._cache.set(agent_id, name)
+        with self._lock:
+            self._stats["primed"] += 1
+
+    def prefetch(self, listing, limit=500):
+        """Cache names from an agent listing and fetch missing ones in the background"""
+        scheduled = 0
+        for agent_id, name in names_from_listing(listing):
+            if name:
+                self.prime(agent_id, name)
+                continue
+            value, stale = self._cache.get(agent_id)
+            if (value is MISSING or stale) and scheduled < limit:
+                self._schedule(agent_id)
+                scheduled += 1
+        return scheduled
+
+    def stats(self):
+        stats = self._cache.stats()
+        with self._lock:
+            stats.update(self._stats)
+            stats["pending"] = len(self._pending)
+        return stats
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+In-flight request coalescing ("singleflight")
+
+Concurrent calls that share a key wait for a single execution and all
+receive its result (or its exception). Nothing is cached once the call
+completes; the next call with the same key runs again.
+"""
+
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls from threads or from one event loop"""
+
+    def __init__(self, name="singleflight"):
+        self.name = name
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "executions": 0, "shared": 0, "errors": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` once for all concurrent callers of ``key``"""
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["shared"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats["executions"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key, coro_fn, *args, **kwargs):
+        """Await ``coro_fn(*args, **kwargs)`` once for all concurrent callers of ``key``.
+
+        All callers must run on the same event loop.
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            future = self._async_calls.get(key)
+            if future is not None:
+                self._stats["shared"] += 1
+            else:
+                future = self._async_calls[key] = asyncio.ensure_future(
+                    self._run_async(key, coro_fn, *args, **kwargs)
+                )
+                self._stats["executions"] += 1
+        # Shield so one cancelled waiter does not cancel the shared call
+        return await asyncio.shield(future)
+
+    async def _run_async(self, key, coro_fn, *args, **kwargs):
+        try:
+            return await coro_fn(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._async_calls.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls) + len(self._async_calls)
+        return stats
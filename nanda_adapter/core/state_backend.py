@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Pluggable state for agent bridge worker processes
+
+A bridge running as several worker processes keeps the state its workers
+must agree on in a StateBackend: small JSON values grouped in namespaces
+(each with a version counter so workers can cheaply notice changes) and a
+FIFO lock per conversation, so the messages of one conversation are handled
+one at a time in arrival order whichever worker receives them.
+
+``memory`` keeps everything in the process (the single-process default).
+``sqlite`` keeps it in a SQLite file shared by every worker on the host;
+place the file on a tmpfs such as /dev/shm to keep it in shared memory.
+ScopedStateBackend prefixes namespaces and conversation ids, so agents that
+share a backend file never see each other's state.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+STATE_BACKENDS = ("memory", "sqlite")
+
+
+def process_alive(pid):
+    """Return False if no process with this pid exists on the host"""
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MemoryStateBackend:
+    """State for a single process"""
+
+    shared = False
+
+    def __init__(self):
+        self._data = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        # conversation_id -> (deque of waiting tokens, Condition); the head holds the lock
+        self._conversations = {}
+        self._stats = {"lock_waits": 0, "lock_timeouts": 0}
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            return self._data.get(namespace, {}).get(key, default)
+
+    def items(self, namespace):
+        with self._lock:
+            return dict(self._data.get(namespace, {}))
+
+    def set(self, namespace, key, value):
+        with self._lock:
+            self._data.setdefault(namespace, {})[key] = value
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def delete(self, namespace, key):
+        with self._lock:
+            if self._data.get(namespace, {}).pop(key, None) is None:
+                return False
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            return True
+
+    def version(self, namespace):
+        with self._lock:
+            return self._versions.get(namespace, 0)
+
+    def acquire_conversation(self, conversation_id, timeout=None):
+        """Wait for this conversation's turn; returns a token, or None on timeout"""
+        token = object()
+        with self._lock:
+            waiting, cond = self._conversations.get(conversation_id, (None, None))
+            if waiting is None:
+                waiting, cond = deque(), threading.Condition(self._lock)
+                self._conversations[conversation_id] = (waiting, cond)
+            waiting.append(token)
+            if waiting[0] is token:
+                return token
+            self._stats["lock_waits"] += 1
+            if cond.wait_for(lambda: waiting[0] is token, timeout):
+                return token
+            self._stats["lock_timeouts"] += 1
+            waiting.remove(token)
+            cond.notify_all()
+            return None
+
+    def release_conversation(self, conversation_id, token):
+        with self._lock:
+            waiting, cond = self._conversations[conversation_id]
+            waiting.remove(token)
+            if waiting:
+                cond.notify_all()
+            else:
+                del self._conversations[conversation_id]
+
+    @contextmanager
+    def conversation_lock(self, conversation_id, timeout=None):
+        """Hold a conversation's lock; on timeout the body runs unlocked"""
+        token = self.acquire_conversation(conversation_id, timeout)
+        if token is None:
+            print(f"Timed out waiting for conversation {conversation_id}; handling it unordered")
+        try:
+            yield token is not None
+        finally:
+            if token is not None:
+                self.release_conversation(conversation_id, token)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["conversations_locked"] = len(self._conversations)
+        stats["backend"] = "memory"
+        return stats
+
+
+class SQLiteStateBackend(MemoryStateBackend):
+    """State in a SQLite file shared by the worker processes of one host.
+
+    Each process opens its own connection on first use, so a backend created
+    before the workers fork is safe to use in all of them. ``path`` may be a
+    callable, called on that first use to name the file. Conversation
+    locks are tickets in arrival order; tickets left behind by a process
+    that died, or older than ``lease``, are discarded.
+    """
+
+    shared = True
+
+    def __init__(self, path, lease=600.0, poll_interval=0.005, poll_max=0.05):
+        super().__init__()
+        self._path = path
+        self.path = None if callable(path) else path
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.poll_max = poll_max
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # Called with self._lock held
+        if self._conn is None or self._pid != os.getpid():
+            if self.path is None:
+                self.path = self._path()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS state ("
+                    " namespace TEXT, key TEXT, value TEXT NOT NULL,"
+                    " PRIMARY KEY (namespace, key))"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS versions ("
+                    " namespace TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS conversation_tickets ("
+                    " id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id TEXT NOT NULL,"
+                    " pid INTEGER NOT NULL, created REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS conversation_tickets_by_conversation"
+                    " ON conversation_tickets (conversation_id, id)"
+                )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _bump(self, conn, namespace):
+        conn.execute("INSERT OR IGNORE INTO versions VALUES (?, 0)", (namespace,))
+        conn.execute(
+            "UPDATE versions SET version = version + 1 WHERE namespace = ?", (namespace,)
+        )
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def items(self, namespace):
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT key, value FROM state WHERE namespace = ?", (namespace,)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def set(self, namespace, key, value):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO state VALUES (?, ?, ?)",
+                    (namespace, key, json.dumps(value)),
+                )
+                self._bump(conn, namespace)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                deleted = conn.execute(
+                    "DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+                ).rowcount
+                if deleted:
+                    self._bump(conn, namespace)
+        return bool(deleted)
+
+    def version(self, namespace):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT version FROM versions WHERE namespace = ?", (namespace,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def _head(self, conn, conversation_id):
+        return conn.execute(
+            "SELECT id, pid, created FROM conversation_tickets"
+            " WHERE conversation_id = ? ORDER BY id LIMIT 1",
+            (conversation_id,),
+        ).fetchone()
+
+    def _abandoned(self, pid, created):
+        return time.time() - created > self.lease or not process_alive(pid)
+
+    def acquire_conversation(self, conversation_id, timeout=None):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                ticket = conn.execute(
+                    "INSERT INTO conversation_tickets (conversation_id, pid, created)"
+                    " VALUES (?, ?, ?)",
+                    (conversation_id, os.getpid(), time.time()),
+                ).lastrowid
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = self.poll_interval
+        waited = False
+        while True:
+            with self._lock:
+                conn = self._connection()
+                head = self._head(conn, conversation_id)
+                if head is None or head[0] == ticket:
+                    break
+                if self._abandoned(head[1], head[2]):
+                    with conn:
+                        conn.execute("DELETE FROM conversation_tickets WHERE id = ?", (head[0],))
+                    print(f"Discarded abandoned lock on conversation {conversation_id}")
+                    continue
+            if deadline is not None and time.monotonic() >= deadline:
+                with self._lock:
+                    conn = self._connection()
+                    with conn:
+                        conn.execute("DELETE FROM conversation_tickets WHERE id = ?", (ticket,))
+                    self._stats["lock_timeouts"] += 1
+                return None
+            waited = True
+            time.sleep(delay)
+            delay = min(self.poll_max, delay * 2)
+        if waited:
+            with self._lock:
+                self._stats["lock_waits"] += 1
+        return ticket
+
+    def release_conversation(self, conversation_id, token):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM conversation_tickets WHERE id = ?", (token,))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["conversations_locked"] = self._connection().execute(
+                "SELECT COUNT(DISTINCT conversation_id) FROM conversation_tickets"
+            ).fetchone()[0]
+        stats.update(backend="sqlite", path=self.path)
+        return stats
+
+
+class ScopedStateBackend:
+    """A state backend whose namespaces and conversation ids get a prefix
+
+    ``scope`` is a string or a callable returning one (called on every use,
+    for scopes such as an agent id that is only known after import).
+    """
+
+    def __init__(self, backend, scope):
+        self.backend = backend
+        self.scope = scope
+
+    @property
+    def shared(self):
+        return self.backend.shared
+
+    def _scoped(self, name):
+        scope = self.scope() if callable(self.scope) else self.scope
+        return f"{scope}:{name}"
+
+    def get(self, namespace, key, default=None):
+        return self.backend.get(self._scoped(namespace), key, default)
+
+    def items(self, namespace):
+        return self.backend.items(self._scoped(namespace))
+
+    def set(self, namespace, key, value):
+        self.backend.set(self._scoped(namespace), key, value)
+
+    def delete(self, namespace, key):
+        return self.backend.delete(self._scoped(namespace), key)
+
+    def version(self, namespace):
+        return self.backend.version(self._scoped(namespace))
+
+    def acquire_conversation(self, conversation_id, timeout=None):
+        return self.backend.acquire_conversation(self._scoped(conversation_id), timeout)
+
+    def release_conversation(self, conversation_id, token):
+        self.backend.release_conversation(self._scoped(conversation_id), token)
+
+    def conversation_lock(self, conversation_id, timeout=None):
+        return self.backend.conversation_lock(self._scoped(conversation_id), timeout)
+
+    def stats(self):
+        stats = self.backend.stats()
+        stats["scope"] = self._scoped("")[:-1]
+        return stats
+
+
+def create_state_backend(kind="memory", path=None):
+    """Return a state backend by name (one of STATE_BACKENDS)
+
+    ``path`` (a file name, or a callable returning one) is used by ``sqlite``.
+    """
+    if kind == "memory":
+        return MemoryStateBackend()
+    if kind == "sqlite":
+        if not path:
+            raise ValueError("the sqlite state backend needs a database path")
+        return SQLiteStateBackend(path)
+    raise ValueError(f"state backend must be one of {STATE_BACKENDS}, got {kind!r}")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Thread-safe in-process TTL cache with LRU bounds, negative entries and
+stale-while-revalidate support.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Sentinel returned by TTLCache.get for keys that are not cached
+MISSING = object()
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "stale_until", "negative")
+
+    def __init__(self, value, expires_at, stale_until, negative):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.negative = negative
+
+
+class TTLCache:
+    """LRU-bounded cache whose entries expire after a per-entry TTL.
+
+    Entries past their TTL but still inside the stale window are returned
+    as stale so callers can serve them while refreshing in the background.
+    Negative entries (value ``None``) record that a key is known to be absent.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0, negative_ttl=30.0, stale_ttl=0.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "negative_hits": 0,
+            "stale_hits": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "refreshes": 0,
+        }
+
+    def get(self, key):
+        """Return ``(value, stale)`` for a cached key or ``(MISSING, False)``"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return MISSING, False
+            if now >= entry.stale_until:
+                del self._data[key]
+                self._stats["misses"] += 1
+                return MISSING, False
+            self._data.move_to_end(key)
+            stale = now >= entry.expires_at
+            if entry.negative:
+                self._stats["negative_hits"] += 1
+            elif stale:
+                self._stats["stale_hits"] += 1
+            else:
+                self._stats["hits"] += 1
+            return entry.value, stale
+
+    def set(self, key, value, ttl=None):
+        """Cache a value; ``None`` is stored as a negative entry"""
+        negative = value is None
+        if ttl is None:
+            ttl = self.negative_ttl if negative else self.ttl
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        # Negative entries are never served stale
+        stale_ttl = 0.0 if negative else self.stale_ttl
+        entry = _Entry(value, now + ttl, now + ttl + stale_ttl, negative)
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, key):
+        """Drop a key from the cache, returning True if it was present"""
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+                return True
+            return False
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._data.clear()
+
+    def get_or_load(self, key, loader):
+        """Return a cached value, calling ``loader(key)`` on a miss.
+
+        Stale entries are returned immediately while ``loader`` runs in a
+        background thread. Exceptions raised by ``loader`` on a miss propagate
+        and nothing is cached.
+        """
+        value, stale = self.get(key)
+        if value is MISSING:
+            value = loader(key)
+            self.set(key, value)
+            return value
+        if stale:
+            self._refresh_in_background(key, loader)
+        return value
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._stats["refreshes"] += 1
+
+        def refresh():
+            try:
+                self.set(key, loader(key))
+            except Exception as e:
+                # Keep serving the stale value until it ages out
+                print(f"Background refresh failed for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def stats(self):
+        """Return hit/miss counters and the current size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._data)
+            stats["maxsize"] = self.maxsize
+        lookups = stats["hits"] + stats["stale_hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+        return stats
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+In-memory mailbox for messages delivered to the UI API
+
+Every message received from the agent bridge gets a sequence number and is
+kept in a bounded ring buffer. UI clients read everything after a cursor;
+each client's cursor is remembered so clients polling without one still see
+every message exactly once. Messages evicted from the ring can optionally be
+spilled to a JSONL file and are then still readable by sequence number: the
+file is indexed by sequence number in memory and rotated once it reaches
+``spill_max_bytes``, keeping one previous file (``<spill_path>.1``).
+"""
+
+import bisect
+import json
+import os
+import threading
+from collections import deque
+
+
+class _SpillSegment:
+    """One spill file with the byte offset of every message it holds"""
+
+    def __init__(self, path):
+        self.path = path
+        self.seqs = []
+        self.offsets = []
+        self.size = 0
+
+
+class MessageMailbox:
+    """Thread-safe ring buffer of UI messages with per-client read cursors"""
+
+    def __init__(self, capacity=1000, spill_path=None, spill_max_bytes=64 * 1024 * 1024):
+        self.capacity = max(1, capacity)
+        self.spill_path = spill_path
+        self.spill_max_bytes = max(1, spill_max_bytes)
+        self._ring = deque()
+        self._next_seq = 1
+        self._cursors = {}
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        # Oldest first; at most the previous file and the current one
+        self._segments = []
+        self._stats = {
+            "posted": 0,
+            "evicted": 0,
+            "spilled": 0,
+            "spill_rotations": 0,
+            "spill_discarded": 0,
+            "reads": 0,
+        }
+
+    @property
+    def latest_seq(self):
+        """Sequence number of the newest message (0 if none yet)"""
+        with self._cond:
+            return self._next_seq - 1
+
+    def post(self, message):
+        """Store a message and return its sequence number"""
+        with self._cond:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._ring.append(dict(message, seq=seq))
+            evicted = []
+            while len(self._ring) > self.capacity:
+                evicted.append(self._ring.popleft())
+            self._stats["posted"] += 1
+            self._stats["evicted"] += len(evicted)
+            self._cond.notify_all()
+        if evicted and self.spill_path:
+            self._spill(evicted)
+        return seq
+
+    def update(self, match, changes):
+        """Apply ``changes`` to buffered messages whose fields equal ``match``.
+
+        Returns the sequence numbers changed; spilled messages are left as is.
+        """
+        with self._cond:
+            changed = []
+            for i, message in enumerate(self._ring):
+                if all(message.get(key) == value for key, value in match.items()):
+                    self._ring[i] = dict(message, **changes)
+                    changed.append(message["seq"])
+        return changed
+
+    def _rotate(self):
+        # Called with self._spill_lock held
+        rotated = bool(self._segments)
+        discarded = 0
+        if rotated:
+            previous = self._segments[-1]
+            os.replace(self.spill_path, self.spill_path + ".1")
+            previous.path = self.spill_path + ".1"
+            discarded = sum(len(segment.seqs) for segment in self._segments[:-1])
+            self._segments = [previous]
+        # Sequence numbers restart with the process, so older spills are not reused
+        open(self.spill_path, "wb").close()
+        segment = _SpillSegment(self.spill_path)
+        self._segments.append(segment)
+        with self._cond:
+            self._stats["spill_rotations"] += rotated
+            self._stats["spill_discarded"] += discarded
+        return segment
+
+    def _spill(self, messages):
+        try:
+            with self._spill_lock:
+                segment = self._segments[-1] if self._segments else None
+                if segment is None or segment.size >= self.spill_max_bytes:
+                    segment = self._rotate()
+                with open(segment.path, "ab") as f:
+                    for message in messages:
+                        line = (json.dumps(message) + "\n").encode("utf-8")
+                        f.write(line)
+                        segment.seqs.append(message["seq"])
+                        segment.offsets.append(segment.size)
+                        segment.size += len(line)
+            with self._cond:
+                self._stats["spilled"] += len(messages)
+        except Exception as e:
+            print(f"Error spilling UI messages to {self.spill_path}: {e}")
+
+    def _read_spill(self, since, before, limit):
+        messages = []
+        try:
+            with self._spill_lock:
+                for segment in self._segments:
+                    if not segment.seqs or segment.seqs[-1] <= since:
+                        continue
+                    if segment.seqs[0] >= before or len(messages) >= limit:
+                        break
+                    # Seek straight to the first message after ``since``
+                    first = bisect.bisect_right(segment.seqs, since)
+                    with open(segment.path, "rb") as f:
+                        f.seek(segment.offsets[first])
+                        for line in f:
+                            message = json.loads(line)
+                            if message["seq"] >= before or len(messages) >= limit:
+                                break
+                            messages.append(message)
+        except Exception as e:
+            print(f"Error reading UI message spill file {self.spill_path}: {e}")
+        return messages
+
+    def read(self, since=0, limit=100):
+        """Return ``(messages, missed)`` for up to ``limit`` messages after ``since``.
+
+        ``missed`` counts messages after ``since`` that were evicted and are not
+        available from the spill file.
+        """
+        with self._cond:
+            self._stats["reads"] += 1
+            first_seq = self._ring[0]["seq"] if self._ring else self._next_seq
+            messages = [m for m in self._ring if m["seq"] > since][:limit]
+
+        missed = 0
+        if since + 1 < first_seq:
+            older = []
+            if self.spill_path:
+                older = self._read_spill(since, first_seq, limit)
+            missed = first_seq - since - 1 - len(older)
+            if older:
+                # Spilled history may itself be cut short by ``limit``
+                messages = (older + messages)[:limit]
+                missed = max(0, older[0]["seq"] - since - 1)
+        return messages, missed
+
+    def wait(self, since, timeout):
+        """Block until a message newer than ``since`` exists or ``timeout`` expires"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._next_seq - 1 > since, timeout)
+
+    def cursor(self, client_id):
+        """Last sequence number acknowledged by a client"""
+        with self._cond:
+            return self._cursors.get(client_id, 0)
+
+    def ack(self, client_id, seq):
+        """Advance a client's cursor (it never moves backwards)"""
+        with self._cond:
+            if seq > self._cursors.get(client_id, 0):
+                self._cursors[client_id] = seq
+
+    def read_for(self, client_id, since=None, limit=100, wait=0):
+        """Read after ``since`` (or the client's cursor) and advance the cursor.
+
+        With ``wait`` > 0 this long-polls: it blocks up to ``wait`` seconds for
+        a newer message when none is pending.
+        """
+        if since is None:
+            since = self.cursor(client_id)
+        if wait > 0:
+            self.wait(since, wait)
+        messages, missed = self.read(since, limit)
+        if messages:
+            self.ack(client_id, messages[-1]["seq"])
+        return messages, missed
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["buffered"] = len(self._ring)
+            stats["capacity"] = self.capacity
+            stats["latest_seq"] = self._next_seq - 1
+            stats["clients"] = len(self._cursors)
+        with self._spill_lock:
+            stats["spill_bytes"] = sum(segment.size for segment in self._segments)
+        return stats
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Background delivery of agent messages to UI clients
+
+``send_to_ui_client`` used to POST to the UI synchronously before the peer
+agent was acknowledged. Each UI client now gets a UIOutbox: a bounded
+pending list drained by its own worker thread(s), which deliver over a
+keep-alive session, retry failures with backoff and append messages they
+cannot deliver to a dead-letter JSONL file. UIClientRegistry fans messages
+out to every registered client; because each client has its own workers a
+slow client only ever delays itself.
+"""
+
+import atexit
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from state_backend import process_alive
+
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+# What to do when a client's pending list is full
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest", "coalesce")
+
+# Outboxes for different clients may share one dead-letter file
+_dead_letter_lock = threading.Lock()
+
+_process_owner = None
+
+
+def process_owner():
+    """Identify this process in stored registrations
+
+    The pid plus a per-process token, so a restarted process that reuses a
+    pid does not adopt the registrations of its predecessor.
+    """
+    global _process_owner
+    pid = os.getpid()
+    if _process_owner is None or _process_owner["pid"] != pid:
+        _process_owner = {"pid": pid, "token": uuid.uuid4().hex}
+    return _process_owner
+
+
+class UIOutbox:
+    """Bounded pending list plus worker threads delivering to one UI client URL"""
+
+    def __init__(
+        self,
+        url,
+        max_pending=1000,
+        workers=1,
+        overflow="drop_newest",
+        retries=3,
+        backoff=0.5,
+        backoff_max=10.0,
+        timeout=10.0,
+        dead_letter_path=None,
+        verify=False,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        self.url = url
+        self.max_pending = max(1, max_pending)
+        # More than one worker trades per-client ordering for throughput
+        self.workers = max(1, workers)
+        self.overflow = overflow
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.dead_letter_path = dead_letter_path
+        self.verify = verify
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._in_flight = 0
+        self._closed = False
+        self._stats = {
+            "queued": 0,
+            "delivered": 0,
+            "retries": 0,
+            "dropped": 0,
+            "coalesced": 0,
+            "dead_lettered": 0,
+            "max_queue_depth": 0,
+        }
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def _ensure_started(self):
+        # Called with self._cond held
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"ui-outbox-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def enqueue(self, payload):
+        """Queue a payload without blocking, applying the overflow policy when full"""
+        accepted = True
+        dropped = None
+        with self._cond:
+            if self._closed:
+                accepted, dropped = False, (payload, "outbox closed")
+            elif len(self._pending) >= self.max_pending:
+                if self.overflow == "coalesce" and self._coalesce(payload):
+                    self._stats["coalesced"] += 1
+                    return True
+                if self.overflow == "drop_newest":
+                    accepted, dropped = False, (payload, "queue full")
+                else:
+                    dropped = (self._pending.popleft(), "client fell behind")
+
+            if accepted:
+                self._pending.append(payload)
+                self._stats["queued"] += 1
+                self._stats["max_queue_depth"] = max(
+                    self._stats["max_queue_depth"], len(self._pending)
+                )
+                self._ensure_started()
+                self._cond.notify()
+            if dropped is not None:
+                self._stats["dropped"] += 1
+
+        if dropped is not None:
+            self._dead_letter(*dropped)
+        return accepted
+
+    def _coalesce(self, payload):
+        # Merge into the newest pending message of the same conversation and sender
+        key = (payload.get("conversation_id"), payload.get("from_agent"))
+        for pending in reversed(self._pending):
+            if (pending.get("conversation_id"), pending.get("from_agent")) == key:
+                pending["message"] = f"{pending['message']}\n{payload['message']}"
+                pending["timestamp"] = payload["timestamp"]
+                return True
+        return False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                payload = self._pending.popleft()
+                self._in_flight += 1
+            try:
+                self._deliver(payload)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+
+    def _deliver(self, payload):
+        attempt = 0
+        while True:
+            error = None
+            try:
+                response = self.session.post(
+                    self.url, json=payload, timeout=self.timeout, verify=self.verify
+                )
+                if response.status_code == 200:
+                    self._count("delivered")
+                    return True
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                retryable = response.status_code in RETRY_STATUSES
+            except requests.RequestException as e:
+                error = str(e)
+                retryable = True
+
+            if not retryable or attempt >= self.retries:
+                print(f"Failed to send message to UI client {self.url}: {error}")
+                self._dead_letter(payload, error)
+                return False
+            self._count("retries")
+            delay = min(self.backoff_max, self.backoff * (2**attempt))
+            time.sleep(random.uniform(delay / 2, delay))
+            attempt += 1
+
+    def _dead_letter(self, payload, reason):
+        self._count("dead_lettered")
+        if not self.dead_letter_path:
+            print(f"Dropping UI message ({reason}): {payload.get('message', '')[:50]}")
+            return
+        record = {
+            "failed_at": datetime.now().isoformat(),
+            "url": self.url,
+            "reason": reason,
+            "payload": payload,
+        }
+        try:
+            with _dead_letter_lock:
+                with open(self.dead_letter_path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+        except Exception as e:
+            print(f"Error writing UI dead letter to {self.dead_letter_path}: {e}")
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._pending)
+            stats["in_flight"] = self._in_flight
+        stats.update(workers=self.workers, max_pending=self.max_pending, overflow=self.overflow)
+        return stats
+
+    def close(self, timeout=10.0):
+        """Stop the workers once they have tried to deliver what is already queued"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self.session.close()
+
+
+class UIClientRegistry:
+    """Registered UI clients, each with its own UIOutbox
+
+    With a shared ``state`` backend registrations are stored there, so every
+    bridge worker process delivers to the same clients. Each stored
+    registration names the process that made it. That process removes it
+    when it closes, and registrations of processes that no longer exist are
+    removed on startup. The default client is never stored: every process
+    resolves it itself.
+    """
+
+    def __init__(self, default_url=None, state=None, **outbox_defaults):
+        # default_url: the primary client, or None to read UI_CLIENT_URL on first use
+        self._default_url = default_url
+        self._default_resolved = False
+        self.state = state
+        self._state_version = None
+        self.outbox_defaults = outbox_defaults
+        self._clients = {}
+        self._options = {}
+        self._lock = threading.Lock()
+        self._registered = False
+        self._pruned = False
+        atexit.register(self.close)
+
+    def _stale(self, owner):
+        if not isinstance(owner, dict) or "pid" not in owner:
+            return True
+        if owner["pid"] == os.getpid():
+            return owner.get("token") != process_owner()["token"]
+        return not process_alive(owner["pid"])
+
+    def _prune(self):
+        """Remove stored registrations left behind by processes that are gone"""
+        for url, entry in self.state.items("ui_clients").items():
+            if self._stale(entry.get("owner") if isinstance(entry, dict) else None):
+                self.state.delete("ui_clients", url)
+                print(f"Removed stale UI client registration {url}")
+
+    def _resolve_default(self):
+        # Launchers set UI_CLIENT_URL after agent_bridge is imported
+        if self._default_resolved:
+            return
+        with self._lock:
+            if self._default_resolved:
+                return
+            if self._default_url is None:
+                self._default_url = os.getenv("UI_CLIENT_URL", "")
+            self._default_resolved = True
+        print(f"UI client URL: '{self._default_url}'")
+        if self._default_url:
+            self._install(self._default_url, {})
+            print(f"Registered UI client {self._default_url}")
+
+    def _install(self, url, options):
+        config = dict(self.outbox_defaults, **options)
+        with self._lock:
+            previous = self._clients.get(url)
+            self._clients[url] = UIOutbox(url, **config)
+            self._options[url] = options
+        if previous is not None:
+            threading.Thread(target=previous.close, daemon=True).start()
+
+    def _uninstall(self, url):
+        with self._lock:
+            outbox = self._clients.pop(url, None)
+            self._options.pop(url, None)
+        if outbox is None:
+            return False
+        threading.Thread(target=outbox.close, daemon=True).start()
+        return True
+
+    def _sync(self):
+        """Resolve the default client and apply registrations made by other workers"""
+        self._resolve_default()
+        if self.state is None:
+            return
+        if not self._pruned:
+            self._pruned = True
+            self._prune()
+        version = self.state.version("ui_clients")
+        if version == self._state_version:
+            return
+        registered = {
+            url: entry.get("options", {})
+            for url, entry in self.state.items("ui_clients").items()
+            if isinstance(entry, dict)
+        }
+        with self._lock:
+            self._state_version = version
+            local = dict(self._options)
+        for url, options in registered.items():
+            if local.get(url) != options:
+                self._install(url, options)
+        for url in local.keys() - registered.keys():
+            if url == self._default_url:
+                if local[url]:
+                    self._install(url, {})
+            else:
+                self._uninstall(url)
+
+    def register(self, url, **options):
+        """Register (or reconfigure) a client; options override the outbox defaults"""
+        self._install(url, options)
+        if self.state is not None:
+            self._registered = True
+            self.state.set("ui_clients", url, {"options": options, "owner": process_owner()})
+        print(f"Registered UI client {url}")
+        return True
+
+    def deregister(self, url):
+        """Remove a client; messages already queued for it are still attempted"""
+        removed = self._uninstall(url)
+        if self.state is not None:
+            removed = self.state.delete("ui_clients", url) or removed
+        if not removed:
+            return False
+        print(f"Deregistered UI client {url}")
+        return True
+
+    def __contains__(self, url):
+        self._sync()
+        with self._lock:
+            return url in self._clients
+
+    def __len__(self):
+        self._sync()
+        with self._lock:
+            return len(self._clients)
+
+    def urls(self):
+        self._sync()
+        with self._lock:
+            return list(self._clients)
+
+    def publish(self, message_text, from_agent, conversation_id):
+        """Queue a message for every registered client; returns how many accepted it"""
+        self._sync()
+        with self._lock:
+            outboxes = list(self._clients.values())
+        if not outboxes:
+            print("No UI clients registered. Cannot send message to UI client")
+            return 0
+        payload = {
+            "message": message_text,
+            "from_agent": from_agent,
+            "conversation_id": conversation_id,
+            "timestamp": datetime.now().isoformat(),
+        }
+        # Each outbox gets its own copy: coalescing edits payloads in place
+        return sum(outbox.enqueue(dict(payload)) for outbox in outboxes)
+
+    def stats(self):
+        """Return delivery stats per client URL"""
+        self._sync()
+        with self._lock:
+            outboxes = dict(self._clients)
+        return {url: outbox.stats() for url, outbox in outboxes.items()}
+
+    def _remove_owned(self):
+        owner = process_owner()
+        for url, entry in self.state.items("ui_clients").items():
+            if isinstance(entry, dict) and entry.get("owner") == owner:
+                self.state.delete("ui_clients", url)
+
+    def close(self, timeout=10.0):
+        if self.state is not None and self._registered:
+            try:
+                self._remove_owned()
+            except Exception as e:
+                print(f"Error removing UI client registrations: {e}")
+        with self._lock:
+            outboxes = list(self._clients.values())
+            self._clients.clear()
+            self._options.clear()
+        for outbox in outboxes:
+            outbox.close(timeout)
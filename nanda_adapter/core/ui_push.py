@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Server-sent event push for UI clients
+
+Each registered client has a bounded queue that receive_message publishes
+into. A client's stream replays what it missed from the MessageMailbox
+(resuming after ``Last-Event-ID``), then forwards live messages, sending
+heartbeat comments while idle. Event ids are mailbox sequence numbers, so a
+reconnecting EventSource resumes exactly where it stopped. Named events sent
+with ``notify`` (e.g. ``sender_name``) carry no id and are not replayed.
+"""
+
+import json
+import queue
+import threading
+import time
+
+# Queue marker: the subscriber overflowed, replay from the mailbox
+_RESYNC = object()
+
+
+class _Notice:
+    __slots__ = ("event", "data")
+
+    def __init__(self, event, data):
+        self.event = event
+        self.data = data
+
+
+class _Subscriber:
+    __slots__ = ("queue", "generation", "connected", "last_sent", "last_seen")
+
+    def __init__(self, queue_size, last_sent):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.generation = 0
+        self.connected = False
+        self.last_sent = last_sent
+        self.last_seen = time.monotonic()
+
+
+class PushHub:
+    """Per-client SSE queues backed by a MessageMailbox for resume"""
+
+    def __init__(self, mailbox, queue_size=1000, heartbeat=15.0, client_ttl=300.0):
+        self.mailbox = mailbox
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.client_ttl = client_ttl
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._stats = {"published": 0, "notices": 0, "events_sent": 0, "resyncs": 0, "expired": 0}
+
+    def register(self, client_id):
+        """Register a client; it receives every message published from now on"""
+        with self._lock:
+            sub = self._subscribers.get(client_id)
+            if sub is None:
+                sub = self._subscribers[client_id] = _Subscriber(
+                    self.queue_size, self.mailbox.latest_seq
+                )
+            sub.last_seen = time.monotonic()
+            return sub
+
+    def unregister(self, client_id):
+        with self._lock:
+            sub = self._subscribers.pop(client_id, None)
+        if sub is None:
+            return False
+        # Wake a connected stream so it notices and exits
+        self._put(sub, _RESYNC)
+        return True
+
+    def _put(self, sub, item):
+        try:
+            sub.queue.put_nowait(item)
+        except queue.Full:
+            # Drop the backlog; the stream replays it from the mailbox
+            while True:
+                try:
+                    sub.queue.get_nowait()
+                except queue.Empty:
+                    break
+            sub.queue.put_nowait(_RESYNC)
+            with self._lock:
+                self._stats["resyncs"] += 1
+
+    def publish(self, message):
+        """Push a mailbox message (with its ``seq``) to every registered client"""
+        now = time.monotonic()
+        with self._lock:
+            self._stats["published"] += 1
+            expired = [
+                client_id
+                for client_id, sub in self._subscribers.items()
+                if not sub.connected and now - sub.last_seen > self.client_ttl
+            ]
+            for client_id in expired:
+                del self._subscribers[client_id]
+            self._stats["expired"] += len(expired)
+            subscribers = list(self._subscribers.values())
+        for sub in subscribers:
+            self._put(sub, message)
+
+    def notify(self, event, data):
+        """Send a named event to connected clients, after what they already queued"""
+        with self._lock:
+            self._stats["notices"] += 1
+            subscribers = [sub for sub in self._subscribers.values() if sub.connected]
+        notice = _Notice(event, data)
+        for sub in subscribers:
+            self._put(sub, notice)
+
+    def _event(self, message):
+        return f"id: {message['seq']}\ndata: {json.dumps(message)}\n\n"
+
+    def stream(self, client_id, last_event_id=None):
+        """Return a generator of SSE frames for ``client_id``.
+
+        A new connection for the same client replaces the previous one.
+        """
+        sub = self.register(client_id)
+        with self._lock:
+            sub.generation += 1
+            generation = sub.generation
+            sub.connected = True
+            # A fresh queue per connection; anything older is replayed below
+            sub.queue = queue.Queue(maxsize=self.queue_size)
+            if last_event_id is not None:
+                sub.last_sent = last_event_id
+            subscription = sub.queue
+
+        def replay():
+            while True:
+                messages, missed = self.mailbox.read(sub.last_sent, limit=100)
+                if missed:
+                    yield f"event: missed\ndata: {json.dumps({'count': missed})}\n\n"
+                if not messages:
+                    return
+                for message in messages:
+                    yield self._event(message)
+                    sub.last_sent = message["seq"]
+                self._count_sent(len(messages))
+
+        def generate():
+            try:
+                yield f"retry: 3000\n: connected as {client_id}\n\n"
+                yield from replay()
+                while True:
+                    try:
+                        item = subscription.get(timeout=self.heartbeat)
+                    except queue.Empty:
+                        item = None
+                    with self._lock:
+                        current = self._subscribers.get(client_id) is sub
+                        if not current or sub.generation != generation:
+                            return
+                        sub.last_seen = time.monotonic()
+                    if item is None:
+                        yield ": heartbeat\n\n"
+                    elif isinstance(item, _Notice):
+                        yield f"event: {item.event}\ndata: {json.dumps(item.data)}\n\n"
+                    elif item is _RESYNC or item["seq"] > sub.last_sent + 1:
+                        yield from replay()
+                    elif item["seq"] > sub.last_sent:
+                        yield self._event(item)
+                        sub.last_sent = item["seq"]
+                        self._count_sent(1)
+            finally:
+                with self._lock:
+                    if sub.generation == generation:
+                        sub.connected = False
+                        sub.last_seen = time.monotonic()
+
+        return generate()
+
+    def _count_sent(self, n):
+        with self._lock:
+            self._stats["events_sent"] += n
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["clients"] = len(self._subscribers)
+            stats["connected"] = sum(sub.connected for sub in self._subscribers.values())
+        return stats
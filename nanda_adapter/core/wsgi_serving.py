@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Serving the agent bridge and the Flask API
+
+By default both apps run on the development servers used so far (python_a2a's
+``run_server`` and Flask's ``app.run(threaded=True)``). With the
+``gunicorn`` server they run under gunicorn instead (``pip install
+nanda-adapter[production]``): pre-forked workers with a pool of threads each,
+keep-alive tuning, graceful reload on SIGHUP and TLS from the same
+``(cert, key)`` pair as Flask's ``ssl_context``. The ``reuseport`` server
+needs no extra dependency: a small pre-fork master runs ``workers`` threaded
+Werkzeug servers that each bind the port with SO_REUSEPORT, so the kernel
+spreads connections across them.
+
+Options default to NANDA_* environment variables so a bridge started as a
+subprocess inherits the launcher's settings.
+
+Worker processes run the callbacks registered with ``on_worker_exit`` as
+they exit, so background writers flush their queues before the process ends.
+
+``workers`` applies to the bridge only. The Flask API keeps its UI mailbox,
+SSE clients and caches in process memory, so it runs ``api_workers``
+processes, 1 by default; more would each see only part of the messages.
+"""
+
+import importlib
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+
+SERVERS = ("development", "gunicorn", "reuseport")
+
+_worker_exit_hooks = []
+# Processes whose hooks have run; gunicorn workers may reach them twice
+_worker_exit_pids = set()
+
+
+def on_worker_exit(func):
+    """Call ``func()`` when a gunicorn or reuseport worker process exits
+
+    Reuseport workers end with ``os._exit`` and skip atexit handlers. Hooks
+    run in reverse registration order, once per process; a single process
+    server relies on atexit instead.
+    """
+    _worker_exit_hooks.append(func)
+    return func
+
+
+def run_worker_exit_hooks():
+    pid = os.getpid()
+    if pid in _worker_exit_pids:
+        return
+    _worker_exit_pids.add(pid)
+    for func in reversed(_worker_exit_hooks):
+        try:
+            func()
+        except Exception as e:
+            print(f"Error in worker exit hook {func!r}: {e}")
+
+
+def serving_options(**overrides):
+    """Return serving options from the environment, updated with ``overrides``"""
+    options = {
+        "server": os.getenv("NANDA_SERVER", "development"),
+        "workers": int(os.getenv("NANDA_WORKERS", "1")),
+        "api_workers": int(os.getenv("NANDA_API_WORKERS", "1")),
+        "threads": int(os.getenv("NANDA_THREADS", "8")),
+        "keepalive": int(os.getenv("NANDA_KEEPALIVE", "5")),
+        "timeout": int(os.getenv("NANDA_WORKER_TIMEOUT", "120")),
+        "graceful_timeout": int(os.getenv("NANDA_GRACEFUL_TIMEOUT", "30")),
+        "max_requests": int(os.getenv("NANDA_MAX_REQUESTS", "0")),
+    }
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    if options["server"] not in SERVERS:
+        raise ValueError(f"server must be one of {SERVERS}, got {options['server']!r}")
+    return options
+
+
+def api_serving_options(options):
+    """Return ``options`` for serving the Flask API: ``api_workers`` workers
+
+    ``max_streams`` caps the API's long-lived responses (SSE streams, relayed
+    bridge streams, long-polls) per worker. Each holds a gunicorn thread, so
+    by default API_RESERVED_THREADS (4) threads stay free for short requests
+    such as the bridge's /api/receive_message. API_MAX_STREAMS overrides
+    it. The development and reuseport servers start a thread per request
+    and need no cap.
+    """
+    max_streams = int(os.getenv("API_MAX_STREAMS", "0")) or None
+    if max_streams is None and options["server"] == "gunicorn":
+        reserved = int(os.getenv("API_RESERVED_THREADS", "4"))
+        max_streams = max(1, options["threads"] - reserved)
+    return dict(options, workers=options.get("api_workers", 1), max_streams=max_streams)
+
+
+def export_serving_options(options):
+    """Set NANDA_* environment variables so child processes use ``options``"""
+    names = {
+        "server": "NANDA_SERVER",
+        "workers": "NANDA_WORKERS",
+        "api_workers": "NANDA_API_WORKERS",
+        "threads": "NANDA_THREADS",
+        "keepalive": "NANDA_KEEPALIVE",
+        "timeout": "NANDA_WORKER_TIMEOUT",
+        "graceful_timeout": "NANDA_GRACEFUL_TIMEOUT",
+        "max_requests": "NANDA_MAX_REQUESTS",
+    }
+    for key, name in names.items():
+        if key in options:
+            os.environ[name] = str(options[key])
+
+
+def add_serving_arguments(parser):
+    """Add --server/--workers/... flags to an argparse parser"""
+    group = parser.add_argument_group("serving")
+    group.add_argument(
+        "--server",
+        choices=SERVERS,
+        help="HTTP server for the bridge and API (default: NANDA_SERVER or development)",
+    )
+    group.add_argument("--workers", type=int, help="Bridge worker processes")
+    group.add_argument(
+        "--api-workers",
+        type=int,
+        help="API worker processes (default 1: the API's state is per process)",
+    )
+    group.add_argument("--threads", type=int, help="Threads per gunicorn worker")
+    group.add_argument("--keepalive", type=int, help="Keep-alive timeout in seconds")
+    group.add_argument(
+        "--worker-timeout", type=int, help="Restart workers silent for this many seconds"
+    )
+    group.add_argument(
+        "--graceful-timeout",
+        type=int,
+        help="Seconds workers get to finish requests on reload or shutdown",
+    )
+    group.add_argument(
+        "--max-requests", type=int, help="Recycle a worker after this many requests (0: never)"
+    )
+    return group
+
+
+def serving_options_from_args(args):
+    """Build serving options from flags added by add_serving_arguments"""
+    return serving_options(
+        server=args.server,
+        workers=args.workers,
+        api_workers=args.api_workers,
+        threads=args.threads,
+        keepalive=args.keepalive,
+        timeout=args.worker_timeout,
+        graceful_timeout=args.graceful_timeout,
+        max_requests=args.max_requests,
+    )
+
+
+def _gunicorn_application(app, config, on_reload=None, on_exit=None):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise ImportError(
+            "The gunicorn server requires gunicorn: pip install nanda-adapter[production]"
+        ) from None
+
+    class _Application(BaseApplication):
+        def load_config(self):
+            for key, value in config.items():
+                self.cfg.set(key, value)
+            if "control_socket_disable" in self.cfg.settings:
+                # Newer gunicorn opens one control socket path per user; the
+                # bridge and API masters would fight over it
+                self.cfg.set("control_socket_disable", True)
+            self.cfg.set("worker_exit", lambda arbiter, worker: run_worker_exit_hooks())
+            if on_reload is not None:
+                self.cfg.set("on_reload", lambda arbiter: on_reload())
+            if on_exit is not None:
+                self.cfg.set("on_exit", lambda arbiter: on_exit())
+
+        def load(self):
+            return app
+
+    return _Application()
+
+
+class _InFlight:
+    """WSGI middleware counting requests whose responses are not finished"""
+
+    def __init__(self, app):
+        self.app = app
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _done(self):
+        with self._lock:
+            self.count -= 1
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wsgi import ClosingIterator
+
+        with self._lock:
+            self.count += 1
+        try:
+            return ClosingIterator(self.app(environ, start_response), [self._done])
+        except BaseException:
+            self._done()
+            raise
+
+
+def _reuseport_worker(app, host, port, ssl_context, options):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+
+    class RequestHandler(WSGIRequestHandler):
+        # HTTP/1.1 keeps connections open; idle ones close after ``keepalive``
+        protocol_version = "HTTP/1.1" if options["keepalive"] > 0 else "HTTP/1.0"
+        timeout = options["keepalive"] or None
+
+    in_flight = _InFlight(app)
+    server = make_server(
+        host,
+        port,
+        in_flight,
+        threaded=True,
+        request_handler=RequestHandler,
+        ssl_context=ssl_context,
+        fd=sock.fileno(),
+    )
+    # The master handles Ctrl+C and SIGHUP and stops workers with SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(
+        signal.SIGTERM,
+        lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start(),
+    )
+    server.serve_forever()
+    deadline = time.monotonic() + options["graceful_timeout"]
+    while in_flight.count > 0 and time.monotonic() < deadline:
+        time.sleep(0.1)
+
+
+def _serve_reuseport(app, host, port, ssl_context, options, on_reload, on_exit, name):
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("the reuseport server needs SO_REUSEPORT support")
+    # pid -> True while serving, False once asked to stop
+    workers = {}
+    flags = {"stop": False, "reload": False}
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _reuseport_worker(app, host, port, ssl_context, options)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                # Flush background writers (conversation logs, outboxes) first
+                run_worker_exit_hooks()
+                os._exit(code)
+        workers[pid] = True
+        return pid
+
+    def retire(pids):
+        for pid in pids:
+            workers[pid] = False
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def request(flag):
+        def handler(signum, frame):
+            flags[flag] = True
+
+        return handler
+
+    signal.signal(signal.SIGTERM, request("stop"))
+    signal.signal(signal.SIGINT, request("stop"))
+    signal.signal(signal.SIGHUP, request("reload"))
+    for _ in range(options["workers"]):
+        spawn()
+    print(f"🚀 {name}: {options['workers']} reuseport workers serving {host}:{port}")
+
+    kill_at = None
+    while workers:
+        if flags["stop"] and kill_at is None:
+            retire(list(workers))
+            kill_at = time.monotonic() + options["graceful_timeout"] + 5
+        if flags["reload"] and kill_at is None:
+            flags["reload"] = False
+            if on_reload is not None:
+                on_reload()
+            # New workers bind the port before the old ones stop accepting
+            old = [pid for pid, serving in workers.items() if serving]
+            for _ in old:
+                spawn()
+            retire(old)
+            print(f"🔄 {name}: reloaded workers")
+        if kill_at is not None and time.monotonic() > kill_at:
+            for pid in list(workers):
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+        # Only reap our own workers: the launcher may have other children
+        for pid in list(workers):
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if not done:
+                continue
+            serving = workers.pop(pid)
+            if serving and kill_at is None:
+                print(f"⚠️ {name}: worker {pid} exited with status {status}; restarting")
+                time.sleep(1)
+                spawn()
+        time.sleep(0.2)
+    if on_exit is not None:
+        on_exit()
+
+
+def serve(
+    app,
+    host,
+    port,
+    ssl_context=None,
+    options=None,
+    on_reload=None,
+    on_exit=None,
+    name="nanda",
+    shared_state=False,
+):
+    """Serve a Flask app until it stops; blocks the calling thread.
+
+    ``options`` comes from serving_options(). gunicorn and reuseport must be
+    started from the main thread; ``on_reload`` and ``on_exit`` run in their
+    master when it is reloaded with SIGHUP or shuts down. ``shared_state``
+    says the app keeps its state where every worker process sees it.
+    """
+    options = options or serving_options()
+    if options["server"] == "development":
+        app.run(host=host, port=port, threaded=True, ssl_context=ssl_context)
+        return
+
+    if threading.current_thread() is not threading.main_thread():
+        # Signal handling needs the main thread, and forking workers from a
+        # thread of a busy process can deadlock them
+        raise RuntimeError(
+            f"the {options['server']} server must be started from the main thread"
+        )
+    if options["workers"] > 1 and not shared_state:
+        print(
+            f"⚠️ {name}: {options['workers']} workers each keep their own "
+            "in-memory state (UI mailbox, SSE clients, caches)"
+        )
+    if options["server"] == "reuseport":
+        _serve_reuseport(app, host, port, ssl_context, options, on_reload, on_exit, name)
+        return
+
+    config = {
+        "bind": [f"{host}:{port}"],
+        "workers": options["workers"],
+        "threads": options["threads"],
+        "worker_class": "gthread",
+        "keepalive": options["keepalive"],
+        "timeout": options["timeout"],
+        "graceful_timeout": options["graceful_timeout"],
+        "max_requests": options["max_requests"],
+        "max_requests_jitter": options["max_requests"] // 10,
+        "proc_name": name,
+    }
+    if ssl_context:
+        config["certfile"], config["keyfile"] = ssl_context
+    print(
+        f"🚀 Serving {name} with gunicorn on {host}:{port} "
+        f"({options['workers']} workers x {options['threads']} threads)"
+    )
+    _gunicorn_application(app, config, on_reload, on_exit).run()
+
+
+def serve_agent(agent, host, port, options=None, shared_state=False):
+    """Serve a python_a2a agent, like python_a2a.run_server
+
+    Several workers need ``shared_state``: conversation locks and UI client
+    registrations kept per process would silently diverge.
+    """
+    options = options or serving_options()
+    if options["server"] != "development" and options["workers"] > 1 and not shared_state:
+        raise ValueError(
+            f"{options['workers']} bridge workers need a shared state backend "
+            "(NANDA_STATE_BACKEND=sqlite)"
+        )
+    if options["server"] == "development":
+        from python_a2a import run_server
+
+        run_server(agent, host=host, port=port)
+        return
+    # Looked up at call time so patches to create_flask_app apply
+    http = importlib.import_module("python_a2a.server.http")
+    app = http.create_flask_app(agent)
+    serve(app, host, port, options=options, name="agent-bridge", shared_state=shared_state)
@@ -47,7 +47,8 @@ setup(
     extras_require={
         "langchain": ["langchain-core", "langchain-anthropic"],
         "crewai": ["crewai", "langchain-anthropic"],
-        "all": ["langchain-core", "langchain-anthropic", "crewai"]
+        "production": ["gunicorn>=21"],
+        "all": ["langchain-core", "langchain-anthropic", "crewai", "gunicorn>=21"]
     },
     entry_points={
         "console_scripts": [